@@ -0,0 +1,254 @@
+import asyncio
+import itertools
+from collections import deque
+
+import zmq
+import zmq.asyncio
+
+import wire_format
+
+
+class AsyncRequester:
+    """Pipelined request/reply over a DEALER socket for use with asyncio.
+
+    Unlike REQ, a DEALER socket can have many requests in flight. Each request
+    carries a "request_id" that the services echo back, and a background task
+    hands every reply to the coroutine waiting for it. Replies without a
+    request_id are matched in order, which is how REP answers a single peer.
+    Once a request times out against such a service the order is lost, so the
+    socket is replaced and the requests still waiting fail.
+    """
+
+    def __init__(self, endpoint, service_name="service", timeout=1500):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.timeout = timeout
+        self._context = zmq.asyncio.Context.instance()
+        self._socket = None
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._order = deque()
+        self._reader = None
+        # whether replies carry our request_id, None until the first reply
+        self._echoes_ids = None
+        self._connect()
+
+    def _connect(self):
+        self._socket = self._context.socket(zmq.DEALER)
+        self._socket.setsockopt(zmq.LINGER, 0)
+        self._socket.connect(self.endpoint)
+
+    def _reset(self):
+        """Replaces the socket and fails every request still waiting for a reply"""
+        if self._reader is not None:
+            self._reader.cancel()
+            self._reader = None
+        self._socket.close()
+        self._connect()
+        self._order.clear()
+        for future in self._pending.values():
+            if not future.done():
+                future.set_result(None)
+
+    async def request(self, data):
+        """Send a request and return the decoded reply, or None if the service didn't answer in time."""
+        if self._reader is None:
+            self._reader = asyncio.ensure_future(self._read_replies())
+
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        self._order.append(request_id)
+        try:
+            # REP expects the empty delimiter frame that REQ would have added
+            await self._socket.send_multipart([b"", wire_format.encode({**data, "request_id": request_id})])
+            return await asyncio.wait_for(future, self.timeout / 1000)
+        except asyncio.TimeoutError:
+            if self._echoes_ids:
+                # the late reply will carry its id and be dropped
+                if request_id in self._order:
+                    self._order.remove(request_id)
+            else:
+                # the late reply would be matched to the next request in line instead
+                self._reset()
+            return None
+        except Exception as e:
+            print(f"Error sending request to {self.service_name}: {e}")
+            return None
+        finally:
+            # a late reply for this id is dropped by _read_replies
+            self._pending.pop(request_id, None)
+
+    async def _read_replies(self):
+        while True:
+            frames = await self._socket.recv_multipart()
+            try:
+                # bad JSON or msgpack both raise ValueError subclasses
+                response = wire_format.decode(frames[-1])
+            except ValueError:
+                response = None
+            if not isinstance(response, dict):
+                # skipped so the reader keeps going. Replies without ids are matched in order, so there it
+                # still answers the oldest request, which fails rather than getting the next one's reply.
+                if self._echoes_ids is False and self._order:
+                    self._fail(self._order.popleft())
+                continue
+            request_id = response.pop("request_id", None)
+            self._echoes_ids = request_id is not None
+            if request_id is None and self._order:
+                request_id = self._order.popleft()
+            elif request_id in self._order:
+                self._order.remove(request_id)
+            future = self._pending.get(request_id)
+            if future is not None and not future.done():
+                future.set_result(response)
+
+    def _fail(self, request_id):
+        future = self._pending.get(request_id)
+        if future is not None and not future.done():
+            future.set_result(None)
+
+    def close(self):
+        if self._reader is not None:
+            self._reader.cancel()
+            self._reader = None
+        self._socket.close()
+
+
+class AsyncPersistenceClient:
+    """asyncio version of PersistenceClient"""
+
+    def __init__(self, endpoint="tcp://localhost:5555", timeout=1500):
+        self.endpoint = endpoint
+        self.seq = None
+        self._transport = AsyncRequester(endpoint, "persistence service", timeout)
+
+    async def save_watchlist(self, items):
+        """Send list to microservice and return True if reply is "success" or otherwise return False"""
+        response = await self._transport.request({"action": "save", "version": 1, "items": items})
+        if response and response.get("status") == "success":
+            self.seq = response.get("seq")
+            return True
+        return False
+
+    async def load_watchlist(self):
+        """Send load request to microservice and return list if reponse is "success" otherwise return None"""
+        response = await self._transport.request({"action": "load", "version": 1})
+        if response and response.get("status") == "success":
+            items = response.get("items", [])
+            if isinstance(items, list):
+                self.seq = response.get("seq")
+                return items
+        return None
+
+    async def add_items(self, items):
+        """Send only the added titles. Returns False if the request failed or our sequence number is stale."""
+        return await self._send_delta("add_items", items)
+
+    async def remove_items(self, items):
+        """Send only the removed titles. Returns False if the request failed or our sequence number is stale."""
+        return await self._send_delta("remove_items", items)
+
+    async def _send_delta(self, action, items):
+        if self.seq is None:
+            return False
+        response = await self._transport.request({"action": action, "version": 1, "seq": self.seq, "items": items})
+        if response and response.get("status") == "success":
+            self.seq = response.get("seq")
+            return True
+        return False
+
+    def close(self):
+        self._transport.close()
+
+
+class AsyncWatchedStatusClient:
+    """asyncio version of WatchedStatusClient. Calls can be awaited concurrently, e.g. with asyncio.gather."""
+
+    def __init__(self, endpoint="tcp://localhost:5557", timeout=1500):
+        self.endpoint = endpoint
+        self._transport = AsyncRequester(endpoint, "watched status service", timeout)
+
+    async def _set_status(self, action, title, rating, watch_date):
+        request_data = {"action": action, "version": 1, "title": title}
+        if rating is not None:
+            request_data["rating"] = rating
+        if watch_date is not None:
+            request_data["watch_date"] = watch_date
+        response = await self._transport.request(request_data)
+        return bool(response) and response.get("status") == "success"
+
+    async def mark_watched(self, title, rating=None, watch_date=None):
+        """Mark a movie as watched."""
+        return await self._set_status("mark_watched", title, rating, watch_date)
+
+    async def mark_unwatched(self, title, rating=None, watch_date=None):
+        """Mark a movie as unwatched."""
+        return await self._set_status("mark_unwatched", title, rating, watch_date)
+
+    async def get_status(self, title):
+        """Get the watch status of a movie."""
+        response = await self._transport.request({"action": "get_status", "version": 1, "title": title})
+        if response and response.get("status") == "success":
+            return {
+                "watched": response.get("watched", False),
+                "rating": response.get("rating"),
+                "watch_date": response.get("watch_date")
+            }
+        return None
+
+    async def mark_watched_many(self, entries):
+        """Mark many movies as watched in a single request. entries is a list of (title, rating, watch_date)."""
+        movies = []
+        for title, rating, watch_date in entries:
+            movie = {"title": title}
+            if rating is not None:
+                movie["rating"] = rating
+            if watch_date is not None:
+                movie["watch_date"] = watch_date
+            movies.append(movie)
+        response = await self._transport.request({"action": "mark_watched_many", "version": 1, "movies": movies})
+        return bool(response) and response.get("status") == "success"
+
+    async def get_status_many(self, titles):
+        """Get the watch status of many movies in a single request, as a dict of title -> status."""
+        response = await self._transport.request({"action": "get_status_many", "version": 1, "titles": titles})
+        if response and response.get("status") == "success":
+            return {title: {"watched": movie.get("watched", False), "rating": movie.get("rating"),
+                            "watch_date": movie.get("watch_date")}
+                    for title, movie in zip(titles, response.get("statuses", []))}
+        return None
+
+    async def get_all_movies(self):
+        """Get all movies and their watch status."""
+        response = await self._transport.request({"action": "get_all_movies", "version": 1})
+        if response and response.get("status") == "success":
+            return response.get("movies", [])
+        return None
+
+    async def get_unwatched_from_list(self, movie_list):
+        """Filter a specific list to show the unwatched movies only."""
+        response = await self._transport.request({"action": "get_unwatched_from_list", "version": 1,
+                                                  "movie_list": movie_list})
+        if response and response.get("status") == "success":
+            return response.get("unwatched_movies", [])
+        return movie_list
+
+    async def get_watched_from_list(self, movie_list):
+        """Filter a specific list to show the watched movies only."""
+        response = await self._transport.request({"action": "get_watched_from_list", "version": 1,
+                                                  "movie_list": movie_list})
+        if response and response.get("status") == "success":
+            return response.get("watched_movies", [])
+        return []
+
+    async def filter_by_status(self, movie_list, watched=True):
+        """Filter a movie list by watch status"""
+        response = await self._transport.request({"action": "filter_by_status", "version": 1,
+                                                  "movie_list": movie_list, "watched": watched})
+        if response and response.get("status") == "success":
+            return response.get("filtered_movies", [])
+        return movie_list if not watched else []
+
+    def close(self):
+        self._transport.close()
@@ -0,0 +1,165 @@
+"""Benchmarks Watchlist operations and client calls against in-process stub services.
+
+Starts the persistence and watched status servers on localhost threads, then
+at each watchlist size times:
+  watchlist.*  - local Watchlist operations (add, contains, get_at_index, remove, flush)
+  persistence.* / watched_status.* - client round trips carrying a list of that size
+
+Results are written as JSON so runs from different commits can be compared with --compare.
+
+Usage: python benchmark.py [--sizes 10 1000 10000 100000] [--calls N] [--output FILE]
+       python benchmark.py --compare BEFORE.json AFTER.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from main import Watchlist
+from persistence_client import PersistenceClient
+from stub_services import start_stub_services
+from watched_status_client import WatchedStatusClient
+
+DEFAULT_SIZES = [10, 1000, 10000, 100000]
+
+
+def make_titles(size):
+    return [f"Benchmark Movie {i}" for i in range(size)]
+
+
+def measure(results, name, size, function, calls):
+    """Times function() over calls runs and appends the result"""
+    start = time.perf_counter()
+    for _ in range(calls):
+        function()
+    elapsed = time.perf_counter() - start
+    results.append({"name": name, "size": size, "calls": calls, "total_ms": round(elapsed * 1000, 3),
+                    "per_call_us": round(elapsed / calls * 1e6, 3)})
+
+
+def measure_each(results, name, size, function, items):
+    """Times function(item) for every item and appends the result"""
+    start = time.perf_counter()
+    for item in items:
+        function(item)
+    elapsed = time.perf_counter() - start
+    results.append({"name": name, "size": size, "calls": len(items), "total_ms": round(elapsed * 1000, 3),
+                    "per_call_us": round(elapsed / max(len(items), 1) * 1e6, 3)})
+
+
+def bench_watchlist(results, size, persistence_endpoint, watch_endpoint):
+    titles = make_titles(size)
+    # queued writes are only flushed when asked, so the local operations are timed without network I/O
+    watchlist = Watchlist(write_behind=True, flush_interval=3600, batch_size=size + 1,
+                          persistence_endpoint=persistence_endpoint, watch_endpoint=watch_endpoint)
+    measure_each(results, "watchlist.add", size, lambda title: watchlist.add(title, quiet=True), titles)
+    measure_each(results, "watchlist.contains", size, watchlist.contains, titles)
+    measure_each(results, "watchlist.get_at_index", size, watchlist.get_at_index,
+                 list(range(0, size, max(size // 100, 1))))
+    measure(results, "watchlist.flush", size, watchlist.flush, 1)
+    measure_each(results, "watchlist.remove", size, lambda title: watchlist.remove(title, quiet=True), titles)
+    measure(results, "watchlist.flush_removes", size, watchlist.flush, 1)
+    watchlist.close()
+
+
+def bench_clients(results, size, calls, persistence_endpoint, watch_endpoint):
+    titles = make_titles(size)
+    persistence = PersistenceClient(persistence_endpoint)
+    # a zero ttl makes every read go to the service instead of the cache
+    watched_status = WatchedStatusClient(watch_endpoint, cache_ttl=0)
+
+    measure(results, "persistence.save_watchlist", size, lambda: persistence.save_watchlist(titles), calls)
+    measure(results, "persistence.load_watchlist", size, persistence.load_watchlist, calls)
+    measure(results, "persistence.load_all_pages", size,
+            lambda: sum(len(page) for page in persistence.iter_watchlist_pages()), calls)
+    extra = iter(range(calls))
+    measure(results, "persistence.add_items", size,
+            lambda: persistence.add_items([f"Extra Movie {next(extra)}"]), calls)
+    persistence.save_watchlist([])
+
+    entries = [(title, i % 10 + 1, None) for i, title in enumerate(titles) if i % 2 == 0]
+    measure(results, "watched_status.mark_watched_many", size,
+            lambda: watched_status.mark_watched_many(entries), calls)
+    measure(results, "watched_status.mark_watched", size,
+            lambda: watched_status.mark_watched(titles[0], rating=8), calls)
+    measure(results, "watched_status.get_status", size, lambda: watched_status.get_status(titles[-1]), calls)
+    measure(results, "watched_status.get_unwatched_from_list", size,
+            lambda: watched_status.get_unwatched_from_list(titles), calls)
+    watched_status.supports_handles = False
+    measure(results, "watched_status.get_unwatched_from_list_inline", size,
+            lambda: watched_status.get_unwatched_from_list(titles), calls)
+    measure(results, "watched_status.get_all_movies", size, watched_status.get_all_movies, calls)
+
+    persistence.close()
+    watched_status.close()
+
+
+def git_commit():
+    try:
+        # from the repo, wherever the benchmark is run from
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(before_path, after_path):
+    """Prints the per-call change of every benchmark present in both result files"""
+    with open(before_path, encoding="utf-8") as f:
+        before = {(r["name"], r["size"]): r for r in json.load(f)["results"]}
+    with open(after_path, encoding="utf-8") as f:
+        after = json.load(f)["results"]
+    print(f"{'benchmark':<48}{'size':>8}{'before us':>13}{'after us':>13}{'change':>9}")
+    for result in after:
+        old = before.get((result["name"], result["size"]))
+        if old is None:
+            continue
+        change = (result["per_call_us"] / old["per_call_us"] - 1) * 100 if old["per_call_us"] else 0.0
+        print(f"{result['name']:<48}{result['size']:>8}{old['per_call_us']:>13.1f}"
+              f"{result['per_call_us']:>13.1f}{change:>+8.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Watchlist operations and client calls")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--calls", type=int, default=20, help="round trips timed per client benchmark")
+    parser.add_argument("--output", "-o", help="write the JSON results here instead of stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"),
+                        help="compare two result files instead of running")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = []
+    # keep stdout for the JSON report, the servers and Watchlist print their messages too
+    with contextlib.redirect_stdout(sys.stderr):
+        persistence_endpoint, watch_endpoint = start_stub_services(persistence_port=15575, watch_port=15577)[2:]
+        for size in args.sizes:
+            print(f"Benchmarking {size} titles...")
+            bench_watchlist(results, size, persistence_endpoint, watch_endpoint)
+            bench_clients(results, size, args.calls, persistence_endpoint, watch_endpoint)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "calls": args.calls,
+        "results": results
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
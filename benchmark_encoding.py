@@ -0,0 +1,57 @@
+"""Compares the JSON (version 1) and msgpack (version 2) wire encodings.
+
+For a "save" request carrying the watchlist and a "get_all_movies" reply
+carrying every movie's status, prints the payload size and the median
+encode/decode time at each list size.
+
+Usage: python benchmark_encoding.py [--sizes 1000 10000 100000] [--runs N]
+"""
+import argparse
+import statistics
+import time
+
+import wire_format
+
+
+def make_messages(size):
+    titles = [f"Movie Title Number {i}" for i in range(size)]
+    save_request = {"action": "save", "version": 1, "items": titles}
+    movies_reply = {"status": "success", "movies": [
+        {"title": title, "watched": i % 2 == 0, "rating": i % 10 + 1, "watch_date": "2024-05-17"}
+        for i, title in enumerate(titles)
+    ]}
+    return {"save items": save_request, "all movies": movies_reply}
+
+
+def time_call(function, argument, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function(argument)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the JSON and msgpack wire encodings")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    versions = {wire_format.JSON_VERSION: "json", wire_format.MSGPACK_VERSION: "msgpack"}
+    if wire_format.msgpack is None:
+        print("msgpack is not installed, only JSON is measured")
+        del versions[wire_format.MSGPACK_VERSION]
+
+    print(f"{'titles':>8} {'message':<11} {'encoding':<8} {'bytes':>11} {'encode ms':>10} {'decode ms':>10}")
+    for size in args.sizes:
+        for name, message in make_messages(size).items():
+            for version, label in versions.items():
+                frame = wire_format.encode(message, version)
+                encode_ms = time_call(lambda data: wire_format.encode(data, version), message, args.runs)
+                decode_ms = time_call(wire_format.decode, frame, args.runs)
+                print(f"{size:>8} {name:<11} {label:<8} {len(frame):>11} {encode_ms:>10.2f} {decode_ms:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Measures Watchlist startup time against local stub services.
+
+Runs each scenario a few times and prints the median of:
+  sequential  - probing persistence then watched status one after the other (the old startup)
+  ui_ready    - Watchlist(background_connect=True) returning, i.e. when the menu can be shown
+  connected   - the background probes finishing
+
+Usage: python benchmark_startup.py [--runs N] [--delay SECONDS]
+"""
+import argparse
+import statistics
+import time
+
+from main import Watchlist
+from persistence_client import PersistenceClient
+from stub_services import start_stub_services
+from watched_status_client import WatchedStatusClient
+
+# nothing listens here, so probes time out like they do when the services are down
+DOWN_PERSISTENCE_ENDPOINT = "tcp://127.0.0.1:15565"
+DOWN_WATCH_ENDPOINT = "tcp://127.0.0.1:15567"
+
+
+def time_sequential(persistence_endpoint, watch_endpoint):
+    start = time.perf_counter()
+    persistence_client = PersistenceClient(persistence_endpoint)
+    persistence_client.load_watchlist()
+    watched_status_client = WatchedStatusClient(watch_endpoint)
+    watched_status_client.get_all_movies()
+    elapsed = time.perf_counter() - start
+    persistence_client.close()
+    watched_status_client.close()
+    return elapsed
+
+
+def time_background(persistence_endpoint, watch_endpoint):
+    start = time.perf_counter()
+    watchlist = Watchlist(background_connect=True, persistence_endpoint=persistence_endpoint,
+                          watch_endpoint=watch_endpoint)
+    ui_ready = time.perf_counter() - start
+    watchlist.wait_until_connected()
+    connected = time.perf_counter() - start
+    return ui_ready, connected
+
+
+def run_scenario(name, persistence_endpoint, watch_endpoint, runs):
+    sequential = []
+    ui_ready = []
+    connected = []
+    for _ in range(runs):
+        sequential.append(time_sequential(persistence_endpoint, watch_endpoint))
+        ready, done = time_background(persistence_endpoint, watch_endpoint)
+        ui_ready.append(ready)
+        connected.append(done)
+    print(f"{name:<14} sequential {statistics.median(sequential) * 1000:8.1f} ms   "
+          f"ui_ready {statistics.median(ui_ready) * 1000:8.1f} ms   "
+          f"connected {statistics.median(connected) * 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Watchlist startup against stub services")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--delay", type=float, default=0.2, help="seconds each stub waits before answering")
+    args = parser.parse_args()
+
+    persistence_endpoint, watch_endpoint = start_stub_services(delay=args.delay)[2:]
+
+    run_scenario("services up", persistence_endpoint, watch_endpoint, args.runs)
+    run_scenario("services down", DOWN_PERSISTENCE_ENDPOINT, DOWN_WATCH_ENDPOINT, args.runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import threading
+
+import zmq
+
+import wire_format
+
+# topics the services publish their change events under
+WATCHLIST_TOPIC = "watchlist"
+STATUS_TOPIC = "status"
+
+
+class ChangePublisher:
+    """PUB socket a service announces its changes on, as [topic, JSON event] messages"""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self._socket = zmq.Context.instance().socket(zmq.PUB)
+        self._socket.setsockopt(zmq.LINGER, 0)
+        self._socket.bind(endpoint)
+
+    def publish(self, topic, event):
+        # events are always JSON so any subscriber can read them, whatever it negotiated for requests
+        self._socket.send_multipart([topic.encode(), wire_format.encode(event, wire_format.JSON_VERSION)])
+
+    def close(self):
+        self._socket.close()
+
+
+class ChangeSubscriber:
+    """Receives the services' change events on a background thread and hands each to the handler for its topic.
+
+    PUB/SUB drops messages while a subscriber is disconnected, so events
+    carry a sequence number for handlers to notice gaps and resync.
+    """
+
+    def __init__(self, endpoints, poll_interval=200):
+        self.endpoints = list(endpoints)
+        # milliseconds between checks for stop()
+        self.poll_interval = poll_interval
+        self._handlers = {}
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def on(self, topic, handler):
+        """Calls handler(event) for every event published under topic"""
+        self._handlers[topic] = handler
+        return self
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        socket = zmq.Context.instance().socket(zmq.SUB)
+        socket.setsockopt(zmq.LINGER, 0)
+        for endpoint in self.endpoints:
+            socket.connect(endpoint)
+        for topic in self._handlers:
+            socket.setsockopt(zmq.SUBSCRIBE, topic.encode())
+        try:
+            while not self._stopped.is_set():
+                if not socket.poll(self.poll_interval):
+                    continue
+                topic, frame = socket.recv_multipart()
+                handler = self._handlers.get(topic.decode())
+                if handler is None:
+                    continue
+                try:
+                    handler(wire_format.decode(frame))
+                except Exception as e:
+                    print(f"Error applying {topic.decode()} change: {e}")
+        finally:
+            socket.close()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join(self.poll_interval / 1000 * 2)
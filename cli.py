@@ -0,0 +1,408 @@
+import argparse
+import json
+import sys
+
+import watchlist_io
+from journal import Journal
+from main import (PERSISTENCE_ENDPOINT, REQUEST_TIMEOUT, WATCH_ENDPOINT, Watchlist, journal_dir_for,
+                  parse_stats_interval, parse_timeout)
+from request_stats import StatsDumper, format_stats
+from titles import title_key
+# shared with the import readers, so ratings from every source pass the same check
+from watchlist_io import parse_rating
+
+
+def read_numbered_lines(paths):
+    """Yields (location, line) for the non-blank lines of each file ("-" is stdin), location being "file:line" """
+    for path in paths or ["-"]:
+        f = sys.stdin if path == "-" else open(path, encoding="utf-8")
+        name = "stdin" if path == "-" else path
+        try:
+            for number, line in enumerate(f, start=1):
+                line = line.strip()
+                if line:
+                    yield f"{name}:{number}", line
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+
+def read_lines(paths):
+    """Yields the non-blank lines of each file ("-" is stdin) one at a time, reading stdin if no files are given"""
+    return (line for location, line in read_numbered_lines(paths))
+
+
+def rating_argument(text):
+    try:
+        return parse_rating(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def timeout_argument(text):
+    try:
+        return parse_timeout(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def stats_interval_argument(text):
+    try:
+        return parse_stats_interval(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def batch_size_argument(text):
+    try:
+        size = int(text)
+    except ValueError:
+        size = 0
+    if size <= 0:
+        raise argparse.ArgumentTypeError(f"must be a positive whole number, not {text!r}")
+    return size
+
+
+def retries_argument(text):
+    try:
+        retries = int(text)
+    except ValueError:
+        retries = -1
+    if retries < 0:
+        raise argparse.ArgumentTypeError(f"must be a whole number of 0 or more, not {text!r}")
+    return retries
+
+
+def parse_watched_line(line, rating=None, watch_date=None):
+    """
+    Splits a "title<TAB>rating<TAB>watch_date" line, rating and watch_date are optional.
+    Raises ValueError if the rating isn't a whole number from 1 to 10.
+    """
+    fields = line.split("\t")
+    title = fields[0].strip().title()
+    if len(fields) > 1 and fields[1].strip():
+        rating = parse_rating(fields[1])
+    if len(fields) > 2 and fields[2].strip():
+        watch_date = fields[2].strip()
+    return title, rating, watch_date
+
+
+def connect(args, **options):
+    """
+    Creates the Watchlist for a command, dumping its service metrics if --stats-file was given.
+    Services are only contacted once the command needs them, see Watchlist.connect().
+    """
+    args.watchlist = Watchlist(persistence_endpoint=args.persistence_endpoint, watch_endpoint=args.watch_endpoint,
+                               timeout=args.timeout, retries=args.retries, lazy_connect=True, **options)
+    if args.stats_file:
+        args.stats_dumper = StatsDumper(args.stats_file, args.watchlist.service_stats, args.stats_interval).start()
+    return args.watchlist
+
+
+def open_watchlist(args):
+    """Connects a Watchlist that commits changes in batches of --batch-size"""
+    watchlist = connect(args, write_behind=True, batch_size=args.batch_size, flush_interval=args.flush_interval,
+                        journal_dir=journal_dir_for(args.persistence_endpoint, "cli"))
+    # the journal already holds the last known watchlist, so it is only loaded from the service on request
+    if not watchlist.connect("persistence"):
+        print("Note: Persistence service unavailable. Changes are kept in the local journal until it is back.",
+              file=sys.stderr)
+    return watchlist
+
+
+def titles_from(args):
+    """Titles given on the command line, otherwise streamed from --file or stdin"""
+    if args.titles:
+        return iter(args.titles)
+    return read_lines(args.file)
+
+
+def watched_entries(args, errors):
+    """
+    Yields (title, rating, watch_date) for every line, stopping at the first bad one.
+    Its error, with the line's location, is appended to errors.
+    """
+    if args.titles:
+        lines = ((f"argument {number}", title) for number, title in enumerate(args.titles, start=1))
+    else:
+        lines = read_numbered_lines(args.file)
+    for location, line in lines:
+        try:
+            yield parse_watched_line(line, args.rating, args.date)
+        except ValueError as e:
+            errors.append(f"{location}: {e}")
+            return
+
+
+def report_unreadable(error, done):
+    """Reports a file that could not be read, done saying what was done before it"""
+    print(f"Error: {error.filename}: {error.strerror}. {done} before it.", file=sys.stderr)
+
+
+def finish(watchlist):
+    """Flushes queued changes, returns the exit code"""
+    if watchlist.persistence_service_available and not watchlist.flush():
+        print("Error: Could not save changes to the persistence service.", file=sys.stderr)
+        watchlist.close()
+        return 1
+    watchlist.close()
+    return 0
+
+
+def add_command(args):
+    watchlist = open_watchlist(args)
+    total = added = 0
+    try:
+        for title in titles_from(args):
+            total += 1
+            if watchlist.add(title, quiet=True):
+                added += 1
+    except OSError as e:
+        report_unreadable(e, f"Added {added} of {total} titles")
+        # the titles added so far are still saved
+        finish(watchlist)
+        return 1
+    print(f"Added {added} of {total} titles.")
+    return finish(watchlist)
+
+
+def remove_command(args):
+    watchlist = open_watchlist(args)
+    total = removed = 0
+    try:
+        for title in titles_from(args):
+            total += 1
+            if watchlist.remove(title, quiet=True):
+                removed += 1
+    except OSError as e:
+        report_unreadable(e, f"Removed {removed} of {total} titles")
+        # the titles removed so far are still saved
+        finish(watchlist)
+        return 1
+    print(f"Removed {removed} of {total} titles.")
+    return finish(watchlist)
+
+
+def report_unmarked(unmarked):
+    """Lists the imported titles whose watch status was not saved, returns True if there were any"""
+    if not unmarked:
+        return False
+    print(f"Error: Could not save the watch status of {len(unmarked)} titles, they were added as unwatched:",
+          file=sys.stderr)
+    for title in unmarked:
+        print(f"  {title}", file=sys.stderr)
+    return True
+
+
+def import_command(args):
+    if args.format == "text":
+        args.titles = []
+        args.file = args.files
+        return add_command(args)
+
+    watchlist = open_watchlist(args)
+    added = marked = 0
+    unmarked = []
+    for path in args.files or ["-"]:
+        try:
+            f = sys.stdin if path == "-" else open(path, encoding="utf-8", newline="")
+        except OSError as e:
+            report_unreadable(e, f"Added {added} titles and marked {marked} as watched")
+            report_unmarked(unmarked)
+            finish(watchlist)
+            return 1
+        try:
+            records = watchlist_io.READERS[args.format](f)
+            file_added, file_marked, file_unmarked = watchlist_io.import_records(watchlist, records,
+                                                                                 args.batch_size)
+        except watchlist_io.RecordError as e:
+            print(f"Error: {'stdin' if path == '-' else path}: {e}. Added {added + e.added} titles and marked "
+                  f"{marked + e.marked} as watched before it.", file=sys.stderr)
+            report_unmarked(unmarked + e.unmarked)
+            # the titles added so far are still saved
+            finish(watchlist)
+            return 1
+        finally:
+            if f is not sys.stdin:
+                f.close()
+        added += file_added
+        marked += file_marked
+        unmarked += file_unmarked
+    print(f"Added {added} titles and marked {marked} as watched.")
+    exit_code = finish(watchlist)
+    if report_unmarked(unmarked):
+        return 1
+    return exit_code
+
+
+def export_command(args):
+    watchlist = connect(args)
+    if not watchlist.connect("persistence"):
+        # an empty file would look like an empty watchlist
+        print("Error: Persistence service unavailable, could not load the watchlist to export.", file=sys.stderr)
+        watchlist.close()
+        return 1
+    if not watchlist.connect("watch"):
+        print("Note: Watch status service unavailable. Titles are exported without their watch status.",
+              file=sys.stderr)
+    records = watchlist_io.iter_records(watchlist, args.batch_size)
+    if args.output in (None, "-"):
+        count = watchlist_io.WRITERS[args.format](records, sys.stdout)
+    else:
+        with open(args.output, "w", encoding="utf-8", newline="") as f:
+            count = watchlist_io.WRITERS[args.format](records, f)
+        print(f"Exported {count} titles to {args.output}.")
+    return 0
+
+
+def local_titles(persistence_endpoint):
+    """
+    The last known watchlist from the interactive session's journal, with the edits the commands here
+    journaled but could not save applied on top. Both journals are only read, without taking their locks,
+    so this works while a session or command has them open.
+    """
+    titles, pending = Journal(journal_dir_for(persistence_endpoint), read_only=True).load()
+    merged = {title_key(title): title for title in titles}
+    cli_titles, cli_pending = Journal(journal_dir_for(persistence_endpoint, "cli"), read_only=True).load()
+    for op, title in cli_pending:
+        if op == "add":
+            merged.setdefault(title_key(title), title)
+        else:
+            merged.pop(title_key(title), None)
+    return list(merged.values())
+
+
+def list_command(args):
+    if args.local:
+        # no service is contacted
+        titles = local_titles(args.persistence_endpoint)
+    else:
+        watchlist = connect(args)
+        if not watchlist.connect("persistence"):
+            # printing nothing would look like an empty watchlist
+            print("Error: Persistence service unavailable, could not load the watchlist. Use --local for the "
+                  "last known one.", file=sys.stderr)
+            watchlist.close()
+            return 1
+        titles = watchlist.titles()
+    for title in titles:
+        print(title)
+    return 0
+
+
+def mark_watched_command(args):
+    # only the watched status service is needed, the saved watchlist is never loaded
+    watchlist = connect(args)
+    if not watchlist.connect("watch"):
+        print("Error: Watch status service unavailable.", file=sys.stderr)
+        return 1
+
+    errors = []
+    marked = 0
+    # the lines before a bad one are still sent, so the count printed is what was marked
+    try:
+        for batch in watchlist_io.chunked(watched_entries(args, errors), args.batch_size):
+            if not watchlist.mark_many_as_watched(batch):
+                print(f"Error: Failed to mark movies as watched after {marked} titles.", file=sys.stderr)
+                return 1
+            marked += len(batch)
+    except OSError as e:
+        report_unreadable(e, f"Marked {marked} titles as watched")
+        watchlist.close()
+        return 1
+    if errors:
+        print(f"Error: {errors[0]}. Marked {marked} titles as watched before it.", file=sys.stderr)
+        return 1
+    print(f"Marked {marked} titles as watched.")
+    return 0
+
+
+def stats_command(args):
+    watchlist = connect(args)
+    watchlist.connect("persistence", "watch")
+    print(json.dumps(watchlist.service_stats(), indent=2))
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="main.py",
+        description="Non-interactive watchlist commands. Run without arguments for the interactive menu.")
+    parser.add_argument("--stats", action="store_true", help="print service request metrics when done")
+    parser.add_argument("--stats-file", help="write service request metrics as JSON to this file periodically")
+    parser.add_argument("--stats-interval", type=stats_interval_argument, default=10.0,
+                        help="seconds between --stats-file updates (default: 10)")
+    parser.add_argument("--persistence-endpoint", default=PERSISTENCE_ENDPOINT,
+                        help="persistence service address (default: $WATCHLIST_PERSISTENCE_ENDPOINT or %(default)s)")
+    parser.add_argument("--watch-endpoint", default=WATCH_ENDPOINT,
+                        help="watched status service address (default: $WATCHLIST_WATCH_ENDPOINT or %(default)s)")
+    parser.add_argument("--timeout", type=timeout_argument, default=REQUEST_TIMEOUT,
+                        help="milliseconds to wait for each service reply (default: $WATCHLIST_TIMEOUT or %(default)s)")
+    parser.add_argument("--retries", type=retries_argument, default=2,
+                        help="times an unanswered request is sent again (default: 2)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    batch_options = argparse.ArgumentParser(add_help=False)
+    batch_options.add_argument("--batch-size", type=batch_size_argument, default=500,
+                               help="number of changes sent to a service per request (default: 500)")
+    batch_options.add_argument("--flush-interval", type=float, default=2.0,
+                               help="seconds between saves of a partial batch (default: 2)")
+
+    def add_title_arguments(subparser):
+        subparser.add_argument("titles", nargs="*", help="movie titles; if none are given they are read from "
+                                                         "--file or stdin, one per line")
+        subparser.add_argument("-f", "--file", action="append", help="read titles from a file (- for stdin)")
+
+    add_parser = subparsers.add_parser("add", parents=[batch_options], help="add movies")
+    add_title_arguments(add_parser)
+    add_parser.set_defaults(func=add_command)
+
+    remove_parser = subparsers.add_parser("remove", parents=[batch_options], help="remove movies")
+    add_title_arguments(remove_parser)
+    remove_parser.set_defaults(func=remove_command)
+
+    import_parser = subparsers.add_parser("import", parents=[batch_options],
+                                          help="add the titles listed in files, with watch status for jsonl/csv")
+    import_parser.add_argument("files", nargs="*", help="files to read (default: stdin)")
+    import_parser.add_argument("--format", choices=["text", "jsonl", "csv"], default="text",
+                               help="text is one title per line (default: text)")
+    import_parser.set_defaults(func=import_command)
+
+    export_parser = subparsers.add_parser("export", parents=[batch_options],
+                                          help="write the watchlist with watch status, rating and date")
+    export_parser.add_argument("--format", choices=["jsonl", "csv"], default="jsonl")
+    export_parser.add_argument("-o", "--output", help="file to write (default: stdout)")
+    export_parser.set_defaults(func=export_command)
+
+    list_parser = subparsers.add_parser("list", help="print the watchlist, one title per line")
+    list_parser.add_argument("--local", action="store_true",
+                             help="print the watchlist kept in the local journal without contacting the services")
+    list_parser.set_defaults(func=list_command)
+
+    mark_parser = subparsers.add_parser("mark-watched", parents=[batch_options],
+                                        help='mark movies as watched; lines may be "title<TAB>rating<TAB>date"')
+    add_title_arguments(mark_parser)
+    mark_parser.add_argument("--rating", type=rating_argument, help="rating 1-10 for titles without one")
+    mark_parser.add_argument("--date", help="watch date for titles without one")
+    mark_parser.set_defaults(func=mark_watched_command)
+
+    stats_parser = subparsers.add_parser("stats", help="connect to the services and print request metrics as JSON")
+    stats_parser.set_defaults(func=stats_command)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.watchlist = None
+    args.stats_dumper = None
+    exit_code = args.func(args)
+    if args.stats and args.watchlist is not None:
+        print(format_stats(args.watchlist.service_stats()), file=sys.stderr)
+    if args.stats_dumper is not None:
+        args.stats_dumper.stop()
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # not on Windows, where journals are left unlocked
+    fcntl = None
+
+from titles import title_key
+
+
+class JournalLocked(Exception):
+    """Raised when another process already has the journal open"""
+
+
+class Journal:
+    """Append-only on-disk log of watchlist edits, so nothing is lost while the persistence service is away.
+
+    Every add/remove is appended to journal.log as one JSON line. Once edits
+    have reached the service a "synced" line records the last op number they
+    covered. compact() folds the log into snapshot.json (written atomically)
+    and starts a new log, so loading at startup only reads the snapshot plus a
+    short tail.
+
+    Writes are flushed to the OS straight away but fsync'd in batches (every
+    fsync_batch ops or fsync_interval seconds, and on sync()/close()), which
+    keeps a local commit well under a millisecond.
+
+    Op numbers are counted per process, so only one process may write a journal at a time: it holds an
+    exclusive lock on the directory until close(), and opening the journal elsewhere raises JournalLocked.
+    A read_only journal takes no lock and can only be loaded.
+    """
+
+    def __init__(self, directory, key=None, fsync_batch=32, fsync_interval=0.5, compact_after=1000,
+                 read_only=False):
+        self.directory = directory
+        self.snapshot_path = os.path.join(directory, "snapshot.json")
+        self.log_path = os.path.join(directory, "journal.log")
+        self._key = key or title_key
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        # number of log lines after which compact() is worth doing
+        self.compact_after = compact_after
+        self.last_op = 0
+        self._log_lines = 0
+        self._unsynced_writes = 0
+        self._last_fsync = time.monotonic()
+        self._log = None
+        self._lock = threading.Lock()
+        self.read_only = read_only
+        self._lock_file = None
+        if not read_only:
+            os.makedirs(directory, exist_ok=True)
+            self._acquire_lock()
+
+    def _acquire_lock(self):
+        self._lock_file = open(os.path.join(self.directory, "lock"), "a")
+        if fcntl is None:
+            return
+        try:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._lock_file.close()
+            self._lock_file = None
+            raise JournalLocked(f"{self.directory} is in use by another process")
+
+    def load(self):
+        """
+        Reads the snapshot and replays the log after it.
+        Returns (titles in order, pending ops) where pending ops is a list of ("add"|"remove", title)
+        that have not been confirmed as saved to the persistence service.
+        """
+        titles = {}
+        pending = []
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+            for title in snapshot.get("titles", []):
+                titles.setdefault(self._key(title), title)
+            pending = [(entry["n"], entry["op"], entry["title"]) for entry in snapshot.get("pending", [])]
+            self.last_op = snapshot.get("last_op", 0)
+        snapshot_op = self.last_op
+
+        self._log_lines = 0
+        if os.path.exists(self.log_path):
+            good_end = 0
+            torn = False
+            with open(self.log_path, "rb") as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("unterminated line")
+                        entry = json.loads(line.decode("utf-8"))
+                    except ValueError:
+                        # a write torn by a crash can only be the last line
+                        torn = True
+                        break
+                    good_end += len(line)
+                    self._log_lines += 1
+                    if entry["n"] <= snapshot_op:
+                        # left over from a compaction interrupted before the log was emptied
+                        continue
+                    self.last_op = entry["n"]
+                    if entry["op"] == "synced":
+                        pending = [op for op in pending if op[0] > entry["upto"]]
+                        continue
+                    if entry["op"] == "add":
+                        titles[self._key(entry["title"])] = entry["title"]
+                    elif entry["op"] == "remove":
+                        titles.pop(self._key(entry["title"]), None)
+                    pending.append((entry["n"], entry["op"], entry["title"]))
+            if torn and not self.read_only:
+                # cut the torn line off, or the next append would be written onto the end of it and lost
+                with open(self.log_path, "r+b") as f:
+                    f.truncate(good_end)
+
+        return list(titles.values()), [(op, title) for n, op, title in pending]
+
+    def _append(self, entry):
+        if self._log is None:
+            self._log = open(self.log_path, "a", encoding="utf-8")
+        self._log.write(json.dumps(entry) + "\n")
+        self._log.flush()
+        self._log_lines += 1
+        self._unsynced_writes += 1
+        if self._unsynced_writes >= self.fsync_batch or time.monotonic() - self._last_fsync >= self.fsync_interval:
+            self._sync()
+
+    def record(self, op, title):
+        """Appends an "add" or "remove" op, returns its op number"""
+        with self._lock:
+            self.last_op += 1
+            self._append({"n": self.last_op, "op": op, "title": title})
+            return self.last_op
+
+    def mark_synced(self, upto):
+        """Records that every op numbered upto or lower has been saved to the persistence service"""
+        with self._lock:
+            self.last_op += 1
+            self._append({"n": self.last_op, "op": "synced", "upto": upto})
+
+    def needs_compaction(self):
+        return self._log_lines >= self.compact_after
+
+    def compact(self, titles, pending):
+        """Replaces the snapshot with the given state and empties the log. pending is a list of (op, title)."""
+        with self._lock:
+            self._compact(titles, pending)
+
+    def _compact(self, titles, pending):
+        snapshot = {
+            "titles": titles,
+            "pending": [{"n": self.last_op, "op": op, "title": title} for op, title in pending],
+            "last_op": self.last_op
+        }
+        temp_path = self.snapshot_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.snapshot_path)
+
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+        open(self.log_path, "w").close()
+        self._log_lines = 0
+        self._unsynced_writes = 0
+
+    def sync(self):
+        """fsyncs the log now"""
+        with self._lock:
+            self._sync()
+
+    def _sync(self):
+        if self._log is not None and self._unsynced_writes:
+            os.fsync(self._log.fileno())
+        self._unsynced_writes = 0
+        self._last_fsync = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            if self._log is not None:
+                self._sync()
+                self._log.close()
+                self._log = None
+            if self._lock_file is not None:
+                # closing the file releases the lock
+                self._lock_file.close()
+                self._lock_file = None
@@ -0,0 +1,240 @@
+"""Load test: runs N simulated Watchlist sessions at once against the services and reports how they cope.
+
+Each session is a thread with its own Watchlist that performs a random mix of actions back to back (or
+--think seconds apart) for --duration seconds. The run is repeated for every session count given, so
+the point where latencies climb and requests start timing out (and sessions drop to memory-only mode)
+shows up as the count grows. For every count it reports:
+  actions/s      - completed session actions per second
+  p50/p95/p99    - action latency as a session sees it, including retries and resyncs
+  failed %       - actions that returned failure, e.g. a save that fell back to the session only
+  timeout %      - unanswered polls per 100 service requests
+  down at start  - sessions that could not reach a service when they connected
+  fallbacks      - sessions that lost a service by the end of the run
+
+Fresh stub services are started in-process for every run unless --persistence-endpoint and
+--watch-endpoint point at running services.
+
+Usage: python load_test.py [--sessions 1 10 50 100] [--duration 10] [--think SECONDS]
+                           [--mix add=4,remove=2,view-unwatched=3,mark-watched=1]
+                           [--delay SECONDS] [--timeout MS] [--watch-db PATH] [--output FILE]
+"""
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+from main import Watchlist
+from request_stats import RequestStats
+from stub_services import start_stub_services
+
+DEFAULT_SESSIONS = [1, 10, 50, 100]
+DEFAULT_MIX = "add=4,remove=2,view-unwatched=3,mark-watched=1"
+# stubs for run n listen on these ports + 10 * n, so a new run never talks to the previous run's services
+PERSISTENCE_PORT = 15675
+WATCH_PORT = 15677
+
+
+class Session:
+    """One simulated user: a Watchlist and the titles it added itself"""
+
+    def __init__(self, number, watchlist, seed):
+        self.number = number
+        self.watchlist = watchlist
+        self.random = random.Random(seed)
+        self.titles = []
+        self._counter = itertools.count()
+
+    def add(self):
+        title = f"Load Movie {self.number}-{next(self._counter)}"
+        if not self.watchlist.add(title, quiet=True):
+            return "add", False
+        self.titles.append(title)
+        return "add", True
+
+    def remove(self):
+        if not self.titles:
+            # nothing of our own to remove yet
+            return self.add()
+        title = self.titles.pop(self.random.randrange(len(self.titles)))
+        return "remove", bool(self.watchlist.remove(title, quiet=True))
+
+    def view_unwatched(self):
+        self.watchlist.get_unwatched_movies()
+        # an empty list is also what comes back when the service is unavailable
+        return "view-unwatched", self.watchlist.watch_service_available
+
+    def mark_watched(self):
+        title = self.random.choice(self.titles) if self.titles else f"Load Movie {self.number}-0"
+        return "mark-watched", self.watchlist.mark_as_watched(title, self.random.randint(1, 10))
+
+
+ACTIONS = {
+    "add": Session.add,
+    "remove": Session.remove,
+    "view-unwatched": Session.view_unwatched,
+    "mark-watched": Session.mark_watched,
+}
+
+
+def parse_mix(text):
+    """Parses "action=weight,..." into (actions, weights)"""
+    actions, weights = [], []
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ACTIONS:
+            raise argparse.ArgumentTypeError(f"unknown action {name!r}, choose from {', '.join(ACTIONS)}")
+        try:
+            weight = float(weight or 1)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"weight of {name} is not a number: {weight!r}")
+        actions.append(ACTIONS[name])
+        weights.append(weight)
+    if not any(weights):
+        raise argparse.ArgumentTypeError("the mix needs at least one action with a positive weight")
+    return actions, weights
+
+
+def run_session(session, actions, weights, deadline, think, stats):
+    """Performs random actions until deadline, recording the latency of each"""
+    while time.monotonic() < deadline:
+        action = session.random.choices(actions, weights)[0]
+        start = time.perf_counter()
+        try:
+            name, ok = action(session)
+        except Exception:
+            name, ok = action.__name__.replace("_", "-"), False
+        stats.record(name, (time.perf_counter() - start) * 1000, 0, 0, ok=ok)
+        if think:
+            time.sleep(session.random.uniform(0, 2 * think))
+
+
+def service_totals(watchlists):
+    """Sums requests, timeouts and failures over every session's service clients"""
+    totals = {"requests": 0, "timeouts": 0, "failures": 0}
+    for watchlist in watchlists:
+        for actions in watchlist.service_stats().values():
+            for stats in actions.values():
+                for counter in totals:
+                    totals[counter] += stats[counter]
+    return totals
+
+
+def run_load(sessions, args, run):
+    """Runs one load level and returns its summary"""
+    if args.persistence_endpoint and args.watch_endpoint:
+        persistence_endpoint, watch_endpoint = args.persistence_endpoint, args.watch_endpoint
+    else:
+        persistence_endpoint, watch_endpoint = start_stub_services(
+            persistence_port=PERSISTENCE_PORT + 10 * run, watch_port=WATCH_PORT + 10 * run, delay=args.delay,
+            watch_db=args.watch_db)[2:]
+
+    # sessions connect before the clock starts, startup is measured by benchmark_startup.py
+    watchlists = [Watchlist(persistence_endpoint=persistence_endpoint, watch_endpoint=watch_endpoint,
+                            timeout=args.timeout, retries=args.retries, background_connect=True)
+                  for _ in range(sessions)]
+    for watchlist in watchlists:
+        watchlist.wait_until_connected()
+    unavailable_at_start = sum(not (w.persistence_service_available and w.watch_service_available)
+                               for w in watchlists)
+
+    actions, weights = args.mix
+    stats = RequestStats()
+    start = time.monotonic()
+    deadline = start + args.duration
+    threads = [threading.Thread(target=run_session,
+                                args=(Session(number, watchlist, args.seed + number), actions, weights, deadline,
+                                      args.think, stats), daemon=True)
+               for number, watchlist in enumerate(watchlists)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+
+    totals = service_totals(watchlists)
+    fallbacks = sum(not (w.persistence_service_available and w.watch_service_available) for w in watchlists)
+    for watchlist in watchlists:
+        watchlist.close()
+
+    per_action = stats.snapshot()
+    done = sum(action["requests"] for action in per_action.values())
+    failed = sum(action["failures"] for action in per_action.values())
+    return {
+        "sessions": sessions,
+        "seconds": round(elapsed, 3),
+        "actions": done,
+        "actions_per_s": round(done / elapsed, 1) if elapsed else None,
+        "p50_ms": stats.percentile(0.50),
+        "p95_ms": stats.percentile(0.95),
+        "p99_ms": stats.percentile(0.99),
+        "failed_pct": round(100 * failed / done, 2) if done else None,
+        "service_requests": totals["requests"],
+        "timeouts": totals["timeouts"],
+        "timeout_pct": round(100 * totals["timeouts"] / totals["requests"], 2) if totals["requests"] else None,
+        "failed_requests": totals["failures"],
+        "unavailable_at_start": unavailable_at_start,
+        "fallbacks": fallbacks,
+        "per_action": per_action,
+    }
+
+
+def _value(value, spec):
+    return "-" if value is None else format(value, spec)
+
+
+def print_report(results, out):
+    print(f"{'sessions':>8}{'actions':>9}{'actions/s':>11}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'failed %':>10}{'requests':>10}{'timeouts':>10}{'timeout %':>11}{'down at start':>15}{'fallbacks':>11}",
+          file=out)
+    for result in results:
+        print(f"{result['sessions']:>8}{result['actions']:>9}{_value(result['actions_per_s'], '.1f'):>11}"
+              f"{_value(result['p50_ms'], '.1f'):>9}{_value(result['p95_ms'], '.1f'):>9}"
+              f"{_value(result['p99_ms'], '.1f'):>9}{_value(result['failed_pct'], '.2f'):>10}"
+              f"{result['service_requests']:>10}{result['timeouts']:>10}{_value(result['timeout_pct'], '.2f'):>11}"
+              f"{result['unavailable_at_start']:>15}{result['fallbacks']:>11}", file=out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run concurrent simulated Watchlist sessions against the services")
+    parser.add_argument("--sessions", type=int, nargs="+", default=DEFAULT_SESSIONS,
+                        help="session counts to run, one after the other")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds each session count runs for")
+    parser.add_argument("--think", type=float, default=0.0,
+                        help="average seconds a session waits between actions (default: 0, back to back)")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                        help=f"relative weights of the actions (default: {DEFAULT_MIX})")
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds each stub waits before answering")
+    parser.add_argument("--timeout", type=int, default=1500, help="milliseconds to wait for each reply")
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--watch-db", help='run the watched status stub on this SQLite database (":memory:" for '
+                                           'a throwaway one) instead of in memory')
+    parser.add_argument("--persistence-endpoint", help="test a running persistence service instead of a stub")
+    parser.add_argument("--watch-endpoint", help="test a running watched status service instead of a stub")
+    parser.add_argument("--output", "-o", help="also write the results, with per-action latencies, as JSON")
+    args = parser.parse_args()
+
+    results = []
+    # the servers and sessions print their messages, keep them out of the report
+    with open(os.devnull, "w") as devnull:
+        for run, sessions in enumerate(args.sessions):
+            print(f"Running {sessions} sessions for {args.duration:g}s...", file=sys.stderr)
+            with contextlib.redirect_stdout(devnull):
+                results.append(run_load(sessions, args, run))
+    print_report(results, sys.stdout)
+
+    if args.output:
+        report = {"duration": args.duration, "think": args.think, "delay": args.delay, "timeout": args.timeout,
+                  "retries": args.retries, "results": results}
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,127 +1,837 @@
-from persistence_client import PersistenceClient
-from watched_status_client import WatchedStatusClient
+import atexit
+import hashlib
+import os
+import sys
+import threading
+import time
+from datetime import date
+from functools import partial
+from itertools import islice
+
+from journal import Journal, JournalLocked
+from request_stats import StatsDumper, format_stats
+from title_index import TitleIndex
+from titles import title_key
+
+# the service clients and change feed import zmq, which takes longer than the rest of startup, so they are
+# only imported once a service is first contacted
+
+# where the local journals of edits are kept, see journal_dir_for()
+DEFAULT_JOURNAL_DIR = os.path.join(os.path.expanduser("~"), ".watchlist")
+
+
+def parse_timeout(value):
+    """Parses a request timeout, which has to be a positive whole number of milliseconds"""
+    try:
+        timeout = int(value)
+    except ValueError:
+        timeout = 0
+    if timeout <= 0:
+        raise ValueError(f"must be a positive whole number of milliseconds, not {value!r}")
+    return timeout
+
+
+def _timeout_from_environment(default=1500):
+    """Reads WATCHLIST_TIMEOUT, falling back to default with a warning if it isn't a positive whole number"""
+    value = os.environ.get("WATCHLIST_TIMEOUT")
+    if value is None:
+        return default
+    try:
+        return parse_timeout(value)
+    except ValueError as e:
+        # importing main must not fail, cli.py, the benchmarks and the load test all start by importing it
+        print(f"Warning: WATCHLIST_TIMEOUT {e}. Using {default}.", file=sys.stderr)
+        return default
+
+
+def parse_stats_interval(value):
+    """Parses the seconds between metrics dumps, which have to be a positive number"""
+    try:
+        interval = float(value)
+    except ValueError:
+        interval = 0
+    # "nan" and "inf" parse, but can't be waited for
+    if not 0 < interval < float("inf"):
+        raise ValueError(f"must be a positive number of seconds, not {value!r}")
+    return interval
+
+
+def _stats_interval_from_environment(default=10.0):
+    """Reads WATCHLIST_STATS_INTERVAL, falling back to default with a warning if it isn't a positive number"""
+    value = os.environ.get("WATCHLIST_STATS_INTERVAL")
+    if value is None:
+        return default
+    try:
+        return parse_stats_interval(value)
+    except ValueError as e:
+        print(f"Warning: WATCHLIST_STATS_INTERVAL {e}. Using {default:g}.", file=sys.stderr)
+        return default
+
+
+# service endpoints and the request timeout in milliseconds, overridable from the environment
+PERSISTENCE_ENDPOINT = os.environ.get("WATCHLIST_PERSISTENCE_ENDPOINT", "tcp://localhost:5555")
+WATCH_ENDPOINT = os.environ.get("WATCHLIST_WATCH_ENDPOINT", "tcp://localhost:5557")
+PERSISTENCE_EVENTS_ENDPOINT = os.environ.get("WATCHLIST_PERSISTENCE_EVENTS_ENDPOINT", "tcp://localhost:5556")
+WATCH_EVENTS_ENDPOINT = os.environ.get("WATCHLIST_WATCH_EVENTS_ENDPOINT", "tcp://localhost:5558")
+REQUEST_TIMEOUT = _timeout_from_environment()
+# times the saved watchlist is read again when other clients change it while its pages are arriving
+LOAD_ATTEMPTS = 3
+# how many movies the ranked views list
+RANKING_LIMIT = 20
+# longer watchlists are searched instead of printed in full when picking a title
+FULL_VIEW_LIMIT = 50
+SUGGESTION_LIMIT = 5
+
+
+def journal_dir_for(persistence_endpoint, client="ui"):
+    """
+    Returns the journal directory for edits bound for one persistence service, so they are never replayed
+    into another. client keeps the one-shot commands out of the interactive session's journal, which
+    takes over the edits they could not save when it starts. Only one process at a time can write a
+    journal, a second one runs without it.
+    """
+    endpoint_hash = hashlib.sha1(persistence_endpoint.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(DEFAULT_JOURNAL_DIR, client, endpoint_hash)
 
 
 class Watchlist:
 
-    def __init__(self):
+    def __init__(self, write_behind=False, flush_interval=2.0, batch_size=50, retry_interval=30.0,
+                 background_connect=False, persistence_endpoint=PERSISTENCE_ENDPOINT,
+                 watch_endpoint=WATCH_ENDPOINT, page_size=1000, journal_dir=None, pool_size=1,
+                 persistence_events_endpoint=None, watch_events_endpoint=None, timeout=REQUEST_TIMEOUT, retries=2,
+                 lazy_connect=False, adopt_journal_dirs=()):
+        # guards _watchlist and the pending changes, which the write-behind thread reads
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._pending_added = {}
+        self._pending_removed = {}
+        # the batch a flush is sending right now
+        self._sending_added = {}
+        self._sending_removed = {}
+        # edits made while the persistence service was unavailable or still loading, sent once it is ready
+        self._unsynced_added = {}
+        self._unsynced_removed = {}
+        # journal op numbers of the pending and unsynced changes, and of every edit not saved yet
+        self._pending_ops = set()
+        self._unsynced_ops = set()
+        self._unsaved_ops = set()
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._flush_requested = threading.Event()
+        self._closed = threading.Event()
+
+        self.persistence_endpoint = persistence_endpoint
+        self.watch_endpoint = watch_endpoint
+        # sockets per service, more than one lets several threads share this watchlist without queueing
+        self.pool_size = pool_size
+        # milliseconds to wait for each reply, and how many times an unanswered request is retried
+        self.timeout = timeout
+        self.retries = retries
+        self.persistence_client = None
+        self.watched_status_client = None
+        self._watchlist = {}
+        # prefix and fuzzy search over the titles, updated with _watchlist
+        self._index = TitleIndex(key=self._key)
+        self.page_size = page_size
+        # True while pages of the saved watchlist are still arriving
+        self.loading = False
+        self.persistence_service_available = False
+        self.watch_service_available = False
+        # seconds to wait before probing an unavailable service again
+        self.retry_interval = retry_interval
+        self._last_probe = 0
+        self._probe_threads = []
+
+        # the journal keeps edits on disk until the persistence service has them, and lets the last
+        # known watchlist show straight away at startup
+        self.journal = None
+        if journal_dir is not None:
+            try:
+                self.journal = Journal(journal_dir, key=self._key)
+            except JournalLocked:
+                # sharing it would mix up the two processes' op numbers, see Journal
+                print("Warning: The local journal is in use by another session. Edits made here are not kept "
+                      "on disk until saved.", file=sys.stderr)
+        if self.journal is not None:
+            titles, pending = self.journal.load()
+            self._watchlist = {self._key(title): title for title in titles}
+            self._index.add_many(titles)
+            for op, title in pending:
+                if op == "add":
+                    self._coalesce([title], [], self._unsynced_added, self._unsynced_removed)
+                else:
+                    self._coalesce([], [title], self._unsynced_added, self._unsynced_removed)
+            if pending:
+                # the loaded pending ops are all numbered up to last_op, marking that synced covers them
+                self._unsynced_ops.add(self.journal.last_op)
+                self._unsaved_ops.add(self.journal.last_op)
+            # edits another client journaled without saving them, e.g. CLI commands run while the service
+            # was down, are taken over so this session sends them
+            for directory in adopt_journal_dirs:
+                self._adopt_journal(directory)
+
+        # changes other clients make are pushed by the services and applied as they arrive
+        self._resyncing = False
+        self.subscriber = None
+        self._events_endpoints = [endpoint for endpoint in (persistence_events_endpoint, watch_events_endpoint)
+                                  if endpoint]
+
+        # with lazy_connect nothing is contacted until a call or connect() needs a service, so a command
+        # waits only for the services it uses. Otherwise with background_connect the watchlist is usable
+        # at once and switches services on as they answer.
+        self._connect_lock = threading.RLock()
+        self._deferred = {"persistence", "watch"} if lazy_connect else set()
+        self._connecting_lazily = set()
+        if not lazy_connect:
+            self._start_subscriber()
+            self._connect_services(wait=not background_connect)
+
+        if self.write_behind:
+            # collapse rapid edits into one save per interval/batch on a background thread
+            self._write_behind_thread = threading.Thread(target=self._write_behind_loop, daemon=True)
+            self._write_behind_thread.start()
+        if self.write_behind or self.journal is not None:
+            atexit.register(self.close)
+
+    def _adopt_journal(self, directory):
+        """Moves the unsaved edits of another client's journal into this one and applies them"""
+        if not os.path.isdir(directory):
+            return
+        try:
+            other = Journal(directory, key=self._key)
+        except JournalLocked:
+            # that client is running and sends them itself
+            return
+        try:
+            titles, pending = other.load()
+            for op, title in pending:
+                key = self._key(title)
+                if op == "add":
+                    if key not in self._watchlist:
+                        self._watchlist[key] = title
+                        self._index.add(title)
+                    self._coalesce([title], [], self._unsynced_added, self._unsynced_removed)
+                else:
+                    item = self._watchlist.pop(key, None)
+                    if item is not None:
+                        self._index.remove(item)
+                    self._coalesce([], [title], self._unsynced_added, self._unsynced_removed)
+                number = self.journal.record(op, title)
+                self._unsynced_ops.add(number)
+                self._unsaved_ops.add(number)
+            if pending:
+                # they are on disk here before they are dropped there. Should that not happen, replaying
+                # them twice only adds or removes the same titles again.
+                self.journal.sync()
+                other.compact(titles, [])
+        finally:
+            other.close()
+
+    def _start_subscriber(self):
+        """Subscribes to the services' change events, if endpoints for them were given"""
+        if self.subscriber is not None or not self._events_endpoints:
+            return
+        from change_feed import STATUS_TOPIC, WATCHLIST_TOPIC, ChangeSubscriber
+        self.subscriber = ChangeSubscriber(self._events_endpoints)
+        self.subscriber.on(WATCHLIST_TOPIC, self._apply_watchlist_change)
+        self.subscriber.on(STATUS_TOPIC, self._apply_status_change)
+        self.subscriber.start()
+
+    def _connect_services(self, wait=True):
+        """Probes each service that is not available yet, concurrently, and switches it on if it answers"""
+        self._last_probe = time.monotonic()
+        probes = []
+        if not self.persistence_service_available and "persistence" not in self._deferred:
+            probes.append(self._connect_persistence)
+        if not self.watch_service_available and "watch" not in self._deferred:
+            probes.append(self._connect_watch_status)
+
+        self._probe_threads = [threading.Thread(target=probe, daemon=True) for probe in probes]
+        for thread in self._probe_threads:
+            thread.start()
+        if wait:
+            self.wait_until_connected()
+
+    def _require(self, service):
+        """Connects to a service left alone by lazy_connect the first time a call needs it"""
+        if service not in self._deferred:
+            return
+        with self._connect_lock:
+            # other threads wait here until the service is loaded, while calls the probe itself makes go on
+            if service not in self._deferred or service in self._connecting_lazily:
+                return
+            self._connecting_lazily.add(service)
+            try:
+                self._last_probe = time.monotonic()
+                self._start_subscriber()
+                if service == "persistence":
+                    self._connect_persistence()
+                else:
+                    self._connect_watch_status()
+            finally:
+                self._connecting_lazily.discard(service)
+                self._deferred.discard(service)
+
+    def connect(self, *services):
+        """
+        Connects now to the named services ("persistence", "watch") that lazy_connect left alone, so a
+        command only waits for the ones it uses. Returns True if all of them are available.
+        """
+        for service in services:
+            self._require(service)
+        available = {"persistence": self.persistence_service_available, "watch": self.watch_service_available}
+        return all(available[service] for service in services)
+
+    def _require_watchlist(self):
+        """With a journal the last known watchlist is already loaded, otherwise it has to come from the service"""
+        if self.journal is None:
+            self._require("persistence")
+
+    @property
+    def connecting(self):
+        """True while a service probe is still waiting for an answer"""
+        return any(thread.is_alive() for thread in self._probe_threads)
+
+    def wait_until_connected(self, timeout=None):
+        """Blocks until the service probes have finished, returns False if timeout ran out first"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._probe_threads:
+            thread.join(None if deadline is None else max(0, deadline - time.monotonic()))
+        return not self.connecting
+
+    def _connect_persistence(self):
+        """
+        Loads the saved watchlist page by page, so the first page can be shown while the rest arrives.
+        Edits made before or during loading are applied on top and then saved.
+        """
         try:
             # create connection to persistence microservice
-            self.persistence_client = PersistenceClient()
+            from persistence_client import PersistenceClient, WatchlistChanged
+            if self.persistence_client is None:
+                self.persistence_client = PersistenceClient(self.persistence_endpoint, timeout=self.timeout,
+                                                            retries=self.retries, pool_size=self.pool_size)
 
             # attempt to load existing data
-            watchlist_data = self.persistence_client.load_watchlist()
-
-            if watchlist_data is not None:
-                # if service connection was successful, load data
-                self._watchlist = watchlist_data
-                self.persistence_service_available = True
-            else:
-                raise Exception("Service not responding")
-        except:
+            pages = self.persistence_client.iter_watchlist_pages(self.page_size)
+            first_page = next(pages)
+        except Exception:
             # use memory-only mode if persistence service unavailable
-            self.persistence_client = None
-            self._watchlist = []
-            self.persistence_service_available = False
+            return
 
+        self.loading = True
+        # keys of a complete read of the saved watchlist, None if every read overlapped another client's save
+        saved_keys = None
+        try:
+            for attempt in range(LOAD_ATTEMPTS):
+                if attempt:
+                    pages = self.persistence_client.iter_watchlist_pages(self.page_size)
+                    first_page = next(pages)
+                keys = set()
+                try:
+                    self._merge_page(first_page, keys)
+                    for page in pages:
+                        self._merge_page(page, keys)
+                except WatchlistChanged:
+                    # the pages already merged only add titles, reading again fills in any that were skipped
+                    continue
+                saved_keys = keys
+                break
+        except Exception:
+            # the service went away part way through, stay in memory-only mode and load again later
+            return
+        finally:
+            self.loading = False
+
+        with self._lock:
+            # drop titles from an old journal snapshot that were removed elsewhere since. A title missing from
+            # a read that overlapped a save may only have been skipped, so nothing is dropped then: our seq is
+            # from before that save, so our next delta is rejected, rebased and followed by another reload.
+            if saved_keys is not None:
+                for key in [key for key in self._watchlist if key not in saved_keys
+                            and key not in self._unsynced_added and key not in self._pending_added
+                            and key not in self._sending_added]:
+                    self._index.remove(self._watchlist.pop(key))
+            # titles added locally go after the saved ones
+            for key in self._unsynced_added:
+                if key in self._watchlist:
+                    self._watchlist[key] = self._watchlist.pop(key)
+            added = list(self._unsynced_added.values())
+            removed = list(self._unsynced_removed.values())
+            ops = self._unsynced_ops
+            self._unsynced_added = {}
+            self._unsynced_removed = {}
+            self._unsynced_ops = set()
+            self.persistence_service_available = True
+        if added or removed:
+            self._persist(added=added, removed=removed, ops=ops)
+        else:
+            # edits that cancelled each other out have nothing to send
+            self._mark_synced(ops)
+        with self._flush_lock:
+            self._compact_journal()
+
+    def _merge_page(self, titles, saved_keys):
+        """Adds one page of saved titles, skipping those removed locally"""
+        with self._lock:
+            new_titles = []
+            for title in titles:
+                key = self._key(title)
+                saved_keys.add(key)
+                if key not in self._watchlist and not self._removing(key):
+                    self._watchlist[key] = title
+                    new_titles.append(title)
+            self._index.add_many(new_titles)
+
+    def _removing(self, key):
+        """True if the title was removed locally and the service may not have been told yet"""
+        return key in self._unsynced_removed or key in self._pending_removed or key in self._sending_removed
+
+    def _connect_watch_status(self):
         try:
             # create connection to watched status microservice
-            self.watched_status_client = WatchedStatusClient()
-            test_result = self.watched_status_client.get_all_movies()
-            self.watch_service_available = test_result is not None
-        except:
-            self.watched_status_client = None
+            if self.watched_status_client is None:
+                from watched_status_client import WatchedStatusClient
+                self.watched_status_client = WatchedStatusClient(self.watch_endpoint, timeout=self.timeout,
+                                                                 retries=self.retries, pool_size=self.pool_size)
+            pages = self.watched_status_client.iter_all_movies(self.page_size)
+            next(pages)
+        except Exception:
             self.watch_service_available = False
+            return
 
-    def add(self, movie_title):
-        """Adds a movie to the watchlist"""
+        self.watch_service_available = True
+        try:
+            # keep reading so the status cache is warm for the first view
+            for page in pages:
+                pass
+        except Exception:
+            pass
+
+    def _apply_watchlist_change(self, event):
+        """Applies a change another client made to the saved watchlist, keeping local edits not yet sent"""
+        client = self.persistence_client
+        if client is None or not self.persistence_service_available or event.get("origin") == client.origin:
+            return
+        outcome = client.accept_change(event.get("seq"))
+        if outcome == "missed":
+            self._resync()
+            return
+        if outcome != "apply":
+            return
+        with self._lock:
+            for title in event.get("removed", []):
+                key = self._key(title)
+                if key in self._pending_added or key in self._sending_added or key in self._unsynced_added:
+                    continue
+                item = self._watchlist.pop(key, None)
+                if item is not None:
+                    self._index.remove(item)
+            for title in event.get("added", []):
+                key = self._key(title)
+                if key in self._watchlist or self._removing(key):
+                    continue
+                self._watchlist[key] = title
+                self._index.add(title)
+
+    def _resync(self):
+        """Reloads the saved watchlist in the background after change events were missed"""
+        with self._lock:
+            if self._resyncing:
+                return
+            self._resyncing = True
+
+        def resync():
+            try:
+                # send our own queued edits first so the reload keeps them
+                self.flush()
+                self._connect_persistence()
+            finally:
+                self._resyncing = False
+
+        threading.Thread(target=resync, daemon=True).start()
+
+    def _apply_status_change(self, event):
+        """Updates cached watch statuses from a change published by the watched status service"""
+        if self.watched_status_client is not None:
+            self.watched_status_client.apply_change(event)
+
+    def reconnect_if_due(self):
+        """Probes unavailable services again once retry_interval has passed, so a hiccup at startup
+        doesn't leave the session in memory-only mode"""
+        if self.connecting or (self.persistence_service_available and self.watch_service_available):
+            return
+        if time.monotonic() - self._last_probe >= self.retry_interval:
+            self._connect_services(wait=False)
+
+    @staticmethod
+    def _key(title):
+        """Returns the case-folded lookup key for a movie title"""
+        return title_key(title)
+
+    def titles(self):
+        """Returns the watchlist titles as a list in insertion order"""
+        self._require_watchlist()
+        with self._lock:
+            return list(self._watchlist.values())
+
+    def add(self, movie_title, quiet=False):
+        """Adds a movie to the watchlist, returns True if it was added. quiet skips the confirmation messages."""
         cleanted_title = movie_title.strip()
         if cleanted_title == "":
-            print("Movie title cannot be blank.")
-            return
+            if not quiet:
+                print("Movie title cannot be blank.")
+            return False
         cleanted_title = cleanted_title.title()
-        if cleanted_title.lower() in [m.lower() for m in self._watchlist]:
-            print(f"{cleanted_title} is already in your watchlist.")
-        else:
-            self._watchlist.append(cleanted_title)
+        key = self._key(cleanted_title)
+        # the saved watchlist has to be merged in before editing, or the merge would drop this title
+        self._require("persistence")
+        with self._lock:
+            if key in self._watchlist:
+                if not quiet:
+                    print(f"{cleanted_title} is already in your watchlist.")
+                return False
+            self._watchlist[key] = cleanted_title
+            self._index.add(cleanted_title)
+            ops = self._record("add", cleanted_title)
+        if not quiet:
             print(f'"{cleanted_title}" has been successfully added to your watchlist.')
-            self._persist()
+        self._persist(added=[cleanted_title], ops=ops)
+        return True
 
-    def remove(self, movie_title):
-        """Removes a movie from the watchlist"""
+    def remove(self, movie_title, quiet=False):
+        """Removes a movie from the watchlist, returns True if it was removed"""
+        self._require("persistence")
         if len(self._watchlist) == 0:
-            print("There are no movies to remove. Your watchlist is empty.")
+            if not quiet:
+                print("There are no movies to remove. Your watchlist is empty.")
             return
 
-        for item in self._watchlist:
-            if item.lower() == movie_title.lower():
-                self._watchlist.remove(item)
+        with self._lock:
+            item = self._watchlist.pop(self._key(movie_title), None)
+            if item is not None:
+                self._index.remove(item)
+                ops = self._record("remove", item)
+        if item is not None:
+            if not quiet:
                 print(f'"{item}" was succefully removed from your watchlist.')
-                self._persist()
-                return True
+            self._persist(removed=[item], ops=ops)
+            return True
 
-        print(f'"{movie_title}" not found in your watchlist.')
+        if not quiet:
+            print(f'"{movie_title}" not found in your watchlist.')
         return False
 
     def view(self):
         """Displays the watchlist as a numbered list"""
-        if len(self._watchlist) == 0:
+        titles = self.titles()
+        if len(titles) == 0 and not self.loading:
             print("Your Watchlist is currently empty.")
         else:
-            for index, item in enumerate(self._watchlist, start=1):
+            for index, item in enumerate(titles, start=1):
                 print(f"{index}. {item}")
+        if self.loading:
+            print("(Still loading the rest of your watchlist...)")
 
     def get_at_index(self, index):
         """Returns the value at an index in the watchlist"""
-        if 0 <= index < len(self._watchlist):
-            return self._watchlist[index]
-        else:
-            print("Invalid index.")
+        self._require_watchlist()
+        # the change feed and resync threads edit the watchlist while it is walked
+        with self._lock:
+            if 0 <= index < len(self._watchlist):
+                return next(islice(self._watchlist.values(), index, None))
+        print("Invalid index.")
 
     def get_size(self):
         """Returns the size of the watchlist"""
+        self._require_watchlist()
         return len(self._watchlist)
 
     def contains(self, title):
         """Returns whether a movie title exists in the watchlist as a boolean, True/False"""
-        return any(title.lower() == movie.lower() for movie in self._watchlist)
-
-    def _persist(self):
+        self._require_watchlist()
+        return self._key(title) in self._watchlist
+
+    def search(self, query, limit=10):
+        """Returns up to limit watchlist titles matching a partial or misspelt title, best match first"""
+        self._require_watchlist()
+        with self._lock:
+            return self._index.search(query, limit)
+
+    def _record(self, op, title):
+        """Journals an edit, returns the op numbers to pass along with it until it is saved"""
+        if self.journal is None:
+            return ()
+        with self._lock:
+            number = self.journal.record(op, title)
+            self._unsaved_ops.add(number)
+        return (number,)
+
+    def _mark_synced(self, ops):
+        """Records in the journal that the edits with these op numbers are saved"""
+        if self.journal is None or not ops:
+            return
+        with self._lock:
+            self._unsaved_ops.difference_update(ops)
+            # the journal marks every op up to a number as synced, so stop short of the oldest edit
+            # another thread has not saved yet
+            upto = min(self._unsaved_ops) - 1 if self._unsaved_ops else max(ops)
+        if upto > 0:
+            self.journal.mark_synced(upto)
+
+    def _persist(self, added=(), removed=(), ops=()):
         """
         Saves the current watchlist to the persistence service if available.
+        Sends only the added/removed titles when the service supports deltas, rebased onto other clients'
+        saves when they got in first, and the full list only to a service that can't take deltas.
         If unavailable, displayes a message indicating that it is only saving in the current session.
+        Without write-behind the changes are saved straight away, together with any that failed before.
+        """
+        with self._lock:
+            if not self.persistence_service_available:
+                # kept until the service is back, see _connect_persistence
+                self._coalesce(added, removed, self._unsynced_added, self._unsynced_removed)
+                self._unsynced_ops.update(ops)
+                return
+        self._queue_changes(added, removed, ops)
+        if not self.write_behind:
+            self.flush()
+
+    def _save(self, added, removed, ops=()):
         """
-        if self.persistence_service_available:
-            success = self.persistence_client.save_watchlist(self._watchlist)
+        Sends the changes to the persistence service, returns True on success.
+        ops are the journal op numbers of the changes, recorded as synced once they are saved.
+        """
+        if self.persistence_client.supports_delta():
+            success = self._persist_delta(added, removed)
+        else:
+            # a service without sequence numbers only takes the whole list
+            success = self.persistence_client.save_watchlist(self.titles())
+        if not success:
+            print("Note: Not connected to persistence service. Your changes were saved only within this session.\n")
+        elif self.journal is not None:
+            self._mark_synced(ops)
+            if self.journal.needs_compaction():
+                self._compact_journal()
+        return success
+
+    def _compact_journal(self):
+        """Folds the journal into a snapshot of the current watchlist and the edits not saved yet"""
+        if self.journal is None:
+            return
+        with self._lock:
+            pending = [("remove", title) for title in self._unsynced_removed.values()]
+            pending += [("add", title) for title in self._unsynced_added.values()]
+            pending += [("remove", title) for title in self._pending_removed.values()]
+            pending += [("add", title) for title in self._pending_added.values()]
+            self.journal.compact(self.titles(), pending)
+            # the snapshot numbers every pending op last_op; callers hold _flush_lock, so no batch is in flight
+            # and all unsaved edits are in the pending or unsynced changes
+            for ops in (self._pending_ops, self._unsynced_ops, self._unsaved_ops):
+                if ops:
+                    ops.clear()
+                    ops.add(self.journal.last_op)
+
+    def _persist_delta(self, added, removed):
+        """
+        Sends added/removed titles as delta operations, returns False if a request failed.
+        A delta rejected because another client saved first is rebased onto their save and sent again, up to
+        retries times, as a full save would overwrite their changes with our copy of the list. After that it
+        counts as failed, so the changes are queued again for the next flush.
+        """
+        client = self.persistence_client
+        rebases = 0
+        success = True
+        # removals go first so a title that was removed and re-added ends up at the end of the list
+        for send, titles in ((client.remove_items, removed), (client.add_items, added)):
+            if not titles:
+                continue
+            while not send(list(titles)):
+                # rebase() is False for no answer or an error rather than a conflict
+                if rebases >= self.retries or not client.rebase():
+                    success = False
+                    break
+                rebases += 1
             if not success:
-                print("Note: Not connected to persistence service. Your changes were saved only within this session.\n")
+                break
+        if rebases:
+            # reload to pick up the other clients' changes
+            self._resync()
+        return success
+
+    def _coalesce(self, added, removed, pending_added, pending_removed):
+        """Records changes in the pending dicts, cancelling out adds and removes of the same title"""
+        for title in removed:
+            key = self._key(title)
+            if pending_added.pop(key, None) is None:
+                pending_removed[key] = title
+        for title in added:
+            pending_added[self._key(title)] = title
+
+    def _queue_changes(self, added, removed, ops=()):
+        """Records changes for the next flush"""
+        with self._lock:
+            self._coalesce(added, removed, self._pending_added, self._pending_removed)
+            self._pending_ops.update(ops)
+            pending = len(self._pending_added) + len(self._pending_removed)
+        if self.write_behind and pending >= self.batch_size:
+            self._flush_requested.set()
+
+    def _requeue(self, added, removed, ops=()):
+        """Puts changes that failed to save back in the queue, ahead of those queued since"""
+        with self._lock:
+            self._pending_ops.update(ops)
+            newer_added, newer_removed = self._pending_added, self._pending_removed
+            self._pending_added = {self._key(title): title for title in added}
+            self._pending_removed = {self._key(title): title for title in removed}
+            self._coalesce(newer_added.values(), newer_removed.values(), self._pending_added,
+                           self._pending_removed)
+
+    def _write_behind_loop(self):
+        """Flushes pending changes every flush_interval seconds, or sooner once batch_size is reached"""
+        while not self._closed.is_set():
+            self._flush_requested.wait(self.flush_interval)
+            self._flush_requested.clear()
+            if self._closed.is_set():
+                # close() does the last flush itself
+                return
+            self.flush()
+
+    def flush(self):
+        """Sends any queued changes to the persistence service. Returns True if nothing is left."""
+        with self._flush_lock:
+            with self._lock:
+                added = list(self._pending_added.values())
+                removed = list(self._pending_removed.values())
+                ops = self._pending_ops
+                self._sending_added, self._sending_removed = self._pending_added, self._pending_removed
+                self._pending_added = {}
+                self._pending_removed = {}
+                self._pending_ops = set()
+            if not (added or removed):
+                self._mark_synced(ops)
+                return True
+            try:
+                if not self._save(added, removed, ops):
+                    # sent again with the next flush, so the service doesn't miss them once it answers
+                    self._requeue(added, removed, ops)
+                    return False
+                return True
+            finally:
+                with self._lock:
+                    self._sending_added = {}
+                    self._sending_removed = {}
+
+    def close(self):
+        """Stops the write-behind thread, sends queued changes and closes the journal. Safe to call again."""
+        with self._lock:
+            if self._closed.is_set():
+                return
+            self._closed.set()
+        atexit.unregister(self.close)
+        if self.write_behind:
+            self._flush_requested.set()
+            if self._write_behind_thread is not threading.current_thread():
+                self._write_behind_thread.join()
+        if self.subscriber is not None:
+            self.subscriber.stop()
+        self.flush()
+        if self.journal is not None:
+            self.journal.close()
+
+    def service_stats(self):
+        """Returns the request metrics of both service clients, keyed by service name"""
+        return {
+            "persistence": self.persistence_client.stats() if self.persistence_client else {},
+            "watched_status": self.watched_status_client.stats() if self.watched_status_client else {}
+        }
 
     def mark_as_watched(self, title, rating=None):
         """Mark a movie as watched with optional rating"""
+        self._require("watch")
         if self.watch_service_available:
             return self.watched_status_client.mark_watched(title, rating)
         return False
 
+    def mark_many_as_watched(self, entries):
+        """Mark many movies as watched in one request. entries is a list of (title, rating, watch_date) tuples."""
+        self._require("watch")
+        if self.watch_service_available:
+            return self.watched_status_client.mark_watched_many(entries)
+        return False
+
     def get_unwatched_movies(self):
         """Get a list of unwatched movies from the current watchlist"""
+        self._require("watch")
         if not self.watch_service_available:
             return []
 
-        return self.watched_status_client.get_unwatched_from_list(self._watchlist)
+        return self.watched_status_client.get_unwatched_from_list(self.titles())
 
     def get_watched_movies(self):
         """Get a list of watched movies from the curernt watchlist"""
+        self._require("watch")
+        if not self.watch_service_available:
+            return []
+
+        return self.watched_status_client.get_watched_from_list(self.titles())
+
+    def top_rated(self, n=20):
+        """Returns the n highest rated watched movies as status dicts, best first"""
+        self._require("watch")
+        if not self.watch_service_available:
+            return []
+        return self.watched_status_client.watch_stats.top_rated(n)
+
+    def recently_watched(self, n=20):
+        """Returns the n most recently watched movies as status dicts, latest first"""
+        self._require("watch")
         if not self.watch_service_available:
             return []
+        return self.watched_status_client.watch_stats.recently_watched(n)
 
-        return self.watched_status_client.get_watched_from_list(self._watchlist)
+    def watched_this_month(self):
+        """Returns the movies watched so far this calendar month, latest first"""
+        self._require("watch")
+        if not self.watch_service_available:
+            return []
+        today = date.today()
+        next_month = date(today.year + today.month // 12, today.month % 12 + 1, 1)
+        return self.watched_status_client.watch_stats.watched_between(today.replace(day=1).isoformat(),
+                                                                      next_month.isoformat())
+
+    def watch_summary(self):
+        """Returns watched/rated counts and the average rating, or None if the service is unavailable"""
+        self._require("watch")
+        if not self.watch_service_available:
+            return None
+        return self.watched_status_client.watch_stats.summary()
 
 
 
 
 class UI:
-    def __init__(self):
-        self._watchlist = Watchlist()
+    """
+    Interactive menus, run as a state machine: every screen method returns the next screen to show
+    (or None to exit) instead of calling it, so run() keeps the stack flat however long a session lasts.
+    """
+
+    def __init__(self, write_behind=True):
+        # saves happen on the write-behind thread and services are probed in the background,
+        # so menu prompts never wait on the network
+        self._watchlist = Watchlist(write_behind=write_behind, background_connect=True,
+                                    journal_dir=journal_dir_for(PERSISTENCE_ENDPOINT),
+                                    adopt_journal_dirs=[journal_dir_for(PERSISTENCE_ENDPOINT, "cli")],
+                                    persistence_events_endpoint=PERSISTENCE_EVENTS_ENDPOINT,
+                                    watch_events_endpoint=WATCH_EVENTS_ENDPOINT)
+
+    def run(self):
+        """Shows screens until one of them returns None"""
+        screen = self.main_menu
+        while screen is not None:
+            screen = screen()
+        self._watchlist.close()
 
     def border(self):
         """Displays a border for text"""
@@ -154,27 +864,56 @@ class UI:
             print("You have chosen to remove a movie by title.\n"
                   "Steps:\n"
                   "1. View your watchlist\n"
-                  "2. Enter the full movie title\n"
+                  "2. Enter the movie title, or part of it and pick from the matches\n"
                   "3. Confirm deletion\n"
                   "4. Choose to remove another movie or return to the main menu selection.")
         self.border()
         input("Press Enter to continue...\n")
 
+    def show_watchlist_for_search(self):
+        """Prints the watchlist, or just its size when it is too long to scroll through"""
+        size = self._watchlist.get_size()
+        if size > FULL_VIEW_LIMIT:
+            print(f"You have {size} movies in your watchlist. Type part of a title to search for it.")
+        else:
+            print("Your Watchlist:")
+            self._watchlist.view()
+
+    def pick_match(self, typed_title):
+        """Offers the watchlist titles closest to one that wasn't found, returns the picked title or None"""
+        matches = self._watchlist.search(typed_title, limit=SUGGESTION_LIMIT)
+        if len(matches) == 0:
+            return None
+        print("Did you mean:")
+        for index, title in enumerate(matches, start=1):
+            print(f"{index}. {title}")
+        while True:
+            choice = input("Enter a number to pick one (or hit Enter to try again):\n").strip()
+            if choice == "":
+                return None
+            try:
+                pick = int(choice)
+                if 1 <= pick <= len(matches):
+                    return matches[pick - 1]
+                print(f"Invalid Input: Please enter a number between 1 and {len(matches)}.")
+            except ValueError:
+                print("Invalid Input: Please enter a valid number or hit Enter to try again.")
+
     def return_to_menu(self):
-        """Returns to the main menu selection"""
+        """Waits for Enter, then returns the main menu as the next screen"""
         while True:
             menu_return = input("\nReturn to main menu... (Press Enter to continue) ")
             if menu_return == "":
-                return self.main_menu()
+                return self.main_menu
             else:
                 print("Invalid input")
 
     def return_to_view_menu(self):
-        """Returns to the view menu selection"""
+        """Waits for Enter, then returns the view menu as the next screen"""
         while True:
             menu_return = input("\nReturn to view menu...(Press Enter to continue) ")
             if menu_return == "":
-                return self.view_watchlist_menu()
+                return self.view_watchlist_menu
             else:
                 print("Invalid input.")
 
@@ -194,34 +933,34 @@ class UI:
         while True:
             addAgain = input("Press 1 to add another movie, or hit Enter to return to main menu...\n")
             if addAgain == '1':
-                return self.add_prompt(show_instructions=False)
+                return partial(self.add_prompt, show_instructions=False)
             elif addAgain == "":
-                return self.main_menu()
+                return self.main_menu
             else:
                 print("Invalid input")
 
     def get_main_menu_choice(self):
         """Returns the correpsonding menu choice for the main menu"""
         main_menu_choice = None
-        while main_menu_choice not in [1, 2, 3, 4]:
+        while main_menu_choice not in [1, 2, 3, 4, 5]:
             try:
                 main_menu_choice = int(input())
-                if main_menu_choice not in [1, 2, 3, 4]:
-                    print("Invalid input: Please enter a number 1-4.")
+                if main_menu_choice not in [1, 2, 3, 4, 5]:
+                    print("Invalid input: Please enter a number 1-5.")
             except ValueError:
-                print("Invalid input: Please enter a number 1-4.")
+                print("Invalid input: Please enter a number 1-5.")
         return main_menu_choice
 
     def get_view_menu_choice(self):
         """Returns the correpsonding menu choice for the view menu"""
         view_menu_choice = None
-        while view_menu_choice not in [1, 2, 3, 4, 5]:
+        while view_menu_choice not in [1, 2, 3, 4, 5, 6, 7]:
             try:
                 view_menu_choice = int(input())
-                if view_menu_choice not in [1, 2, 3, 4, 5]:
-                    print("Invalid input: Please enter a number 1-5.")
+                if view_menu_choice not in [1, 2, 3, 4, 5, 6, 7]:
+                    print("Invalid input: Please enter a number 1-7.")
             except ValueError:
-                print("Invalid input: Please enter a number 1-5.")
+                print("Invalid input: Please enter a number 1-7.")
         return view_menu_choice
 
     def view_watchlist_menu(self):
@@ -233,9 +972,11 @@ class UI:
               "2. View Unwatched Only\n"
               "3. View Watched Only\n"
               "4. Mark Movie as Watched\n"
-              "5. Return to Main Menu\n"
+              "5. View Top Rated\n"
+              "6. View Recently Watched\n"
+              "7. Return to Main Menu\n"
               "\n"
-              "Enter your choice (1-5):")
+              "Enter your choice (1-7):")
 
         view_choice = self.get_view_menu_choice()
 
@@ -243,24 +984,32 @@ class UI:
             self.print_header('View All Movies')
             # show basic numbered watchlist
             self._watchlist.view()
-            self.return_to_view_menu()
+            return self.return_to_view_menu()
 
         elif view_choice == 2:
             self.print_header('View Unwatched Movies Only')
             # show only unwatched movies
-            self.display_unwatched()
+            return self.display_unwatched
 
         elif view_choice == 3:
             self.print_header('View Watched Movies Only')
             # show only watched movies
-            self.display_watched()
+            return self.display_watched
 
         elif view_choice == 4:
             self.print_header('Mark Movie as Watched')
-            self.mark_as_watched_prompt()
+            return self.mark_as_watched_prompt
 
         elif view_choice == 5:
-            return self.main_menu()
+            self.print_header('View Top Rated')
+            return self.display_top_rated
+
+        elif view_choice == 6:
+            self.print_header('View Recently Watched')
+            return self.display_recently_watched
+
+        elif view_choice == 7:
+            return self.main_menu
 
     def mark_as_watched_prompt(self):
         """Prompts the user to mark a movie as watched."""
@@ -270,28 +1019,28 @@ class UI:
         if not self._watchlist.watch_service_available:
             print("Watch status service unavailable. Cannot mark movies as watched.")
             input("Press Enter to continue...")
-            return self.view_watchlist_menu()
+            return self.view_watchlist_menu
 
         # show watchlist
-        print("Your Watchlist:")
-        self._watchlist.view()
+        self.show_watchlist_for_search()
 
         if self._watchlist.get_size() == 0:
             print("Your watchlist is empty. Go to main menu to add movies.")
             input("Press Enter to continue...")
-            return self.main_menu()
+            return self.main_menu
 
         # get movie title
         movie_title = input("\n Enter the title of the movie to mark as watched (or hit Enter to cancel):"
                             "\n").strip().title()
         if movie_title == "":
-            return self.view_watchlist_menu()
+            return self.view_watchlist_menu
 
-        # check if movie is in watchlist
+        # check if movie is in watchlist, offering close matches if not
         if not self._watchlist.contains(movie_title):
             print(f'"{movie_title}" is not in your watchlist.')
-            input("Press Enter to continue...")
-            return self.mark_as_watched_prompt()
+            movie_title = self.pick_match(movie_title)
+            if movie_title is None:
+                return self.mark_as_watched_prompt
 
         # get optional rating
         rating = None
@@ -322,11 +1071,12 @@ class UI:
         while True:
             mark_another = input("Press 2 to mark another movie as watched, or hit Enter to return to view menu...\n")
             if mark_another == "1":
-                return self.mark_as_watched_prompt()
+                return self.mark_as_watched_prompt
             elif mark_another == "":
-                return self.view_watchlist_menu()
+                return self.view_watchlist_menu
             else:
                 print("Invalid input")
+
     def display_unwatched(self):
         """Display only unwatched movies as a numbered list"""
         if not self._watchlist.watch_service_available:
@@ -358,8 +1108,55 @@ class UI:
 
         return self.return_to_view_menu()
 
+    def print_watch_summary(self):
+        """Prints the watched/rated counts and average rating above a ranked view"""
+        summary = self._watchlist.watch_summary()
+        if summary is None:
+            return
+        average = f"{summary['average_rating']:.1f}/10" if summary["average_rating"] is not None else "-"
+        print(f"Watched {summary['watched']} of {summary['movies']} movies, "
+              f"{summary['rated']} rated, average rating {average}\n")
+
+    def display_top_rated(self):
+        """Display the highest rated watched movies"""
+        if not self._watchlist.watch_service_available:
+            print("Watch status service unavailable. Cannot show ratings.")
+            return self.return_to_view_menu()
+
+        self.print_watch_summary()
+        top_rated = self._watchlist.top_rated(RANKING_LIMIT)
+        if len(top_rated) == 0:
+            print("You have not rated any movies yet.")
+        else:
+            print(f"Top {len(top_rated)} Rated Movies:")
+            for index, movie in enumerate(top_rated, start=1):
+                print(f"{index}. {movie['title']} - {movie['rating']}/10")
+
+        return self.return_to_view_menu()
+
+    def display_recently_watched(self):
+        """Display the most recently watched movies"""
+        if not self._watchlist.watch_service_available:
+            print("Watch status service unavailable. Cannot show recently watched movies.")
+            return self.return_to_view_menu()
+
+        print(f"Movies watched this month: {len(self._watchlist.watched_this_month())}\n")
+        recent = self._watchlist.recently_watched(RANKING_LIMIT)
+        if len(recent) == 0:
+            print("You have not watched any movies yet.")
+        else:
+            print("Recently Watched Movies:")
+            for index, movie in enumerate(recent, start=1):
+                rating = f" - {movie['rating']}/10" if movie["rating"] is not None else ""
+                print(f"{index}. {movie['title']} (watched {movie['watch_date']}){rating}")
+
+        return self.return_to_view_menu()
+
     def confirm_and_delete(self, title):
-        """Prompts the user for removal confirmation and deletes the movie selected if it exists"""
+        """
+        Prompts the user for removal confirmation and deletes the movie selected if it exists.
+        Returns the main menu as the next screen if the watchlist is now empty, otherwise None.
+        """
         print(f'Are you sure you want to remove "{title}" from your watchlist?\n'
               "Any associated data will also be removed and cannot be undone.")
         confirm_delete = str(input("Enter 'Y' to confirm deletion\n"))
@@ -370,12 +1167,30 @@ class UI:
                 return self.return_to_menu()
         else:
             print(f'Invalid Input: "{title}" not removed')
+        return None
+
+    def remove_another_prompt(self, again_screen):
+        """Asks whether to remove another movie, returns again_screen or the main menu"""
+        while True:
+            remove_more = input("Would you like to remove a movie? Press 1 to remove, or hit "
+                                "Enter to return to Main Menu\n")
+            if remove_more == "1":
+                return again_screen
+            elif remove_more == "":
+                return self.return_to_menu()
+            else:
+                print(f'Invalid input: Press 1 to remove another movie or Enter to return to '
+                      f'Main Menu')
 
     def main_menu(self):
-        """Action menu loop"""
+        """Action menu"""
+        self._watchlist.reconnect_if_due()
+
         # status indicator showing persistence service avaiability
         if self._watchlist.persistence_service_available:
             print("[Saving: ON]")
+        elif self._watchlist.connecting:
+            print("[Connecting...]")
         else:
             print("[Memory Mode]")
 
@@ -389,133 +1204,144 @@ class UI:
               "\n1. View Watchlist"
               "\n2. Add Movie"
               "\n3. Remove Movie"
-              "\n4. Exit"
-              "\nEnter your choice (1-4):")
+              "\n4. Service Stats"
+              "\n5. Exit"
+              "\nEnter your choice (1-5):")
 
         main_menu_choice = self.get_main_menu_choice()
 
         if main_menu_choice == 1:
-            self.view_watchlist_menu()
+            return self.view_watchlist_menu
 
         elif main_menu_choice == 2:
             self.print_header('Add Movie')
-            self.add_prompt(show_instructions=True)
+            return partial(self.add_prompt, show_instructions=True)
 
         elif main_menu_choice == 3:
-            self.print_header('Remove Movie')
-            print("Your Watchlist:")
-            self._watchlist.view()
-
-            print("\nHow would you like to remove a movie?\n"
-                  "1. By list number\n"
-                  "2. By movie title\n"
-                  "3. Cancel and return to main menu\n"
-                  "\n"
-                  "Enter your choice (1-3):")
-
-            remove_choice = None
-            while remove_choice not in [1, 2, 3]:
-                try:
-                    remove_choice = int(input())
-                    if remove_choice not in [1, 2, 3]:
-                        print("Invalid input: Please choose from options 1-3.")
-                except ValueError:
-                    print("Invalid input: Please enter a valid number.")
-
-                if remove_choice == 1:
-                    show_instructions = True
-                    while True:
-                        if self._watchlist.get_size() == 0:
-                            print("There are no movies to remove. Your watchlist is empty.")
-                            return self.return_to_menu()
-
-                        self.print_header('Remove Movie by List Number')
-
-                        if show_instructions:
-                            self.display_steps("remove_by_num")
-                            show_instructions = False
-
-                        print("Your Watchlist:")
-                        self._watchlist.view()
-
-                        movie_to_remove = None
-                        while movie_to_remove is None:
-                            remove_input = input("\nEnter the corresponding number of the movie to remove"
-                                                 " (or hit Enter to cancel):\n>")
-                            if remove_input.strip() == "":
-                                return self.return_to_menu()
-                            try:
-                                remove_num = int(remove_input)
-                                if 0 < remove_num <= self._watchlist.get_size():
-                                    movie_to_remove = self._watchlist.get_at_index(remove_num - 1)
-                                else:
-                                    print("Invalid input: No movie with that number exists.")
-                            except ValueError:
-                                print("Invalid Input: Please enter a valid number or hit Enter to cancel.")
-
-                        self.confirm_and_delete(movie_to_remove)
-
-                        while True:
-                            remove_more = input("Would you like to remove a movie? Press 1 to remove, or hit "
-                                                "Enter to return to Main Menu\n")
-                            if remove_more == "1":
-                                break
-                            elif remove_more == "":
-                                return self.return_to_menu()
-                            else:
-                                print(f'Invalid input: Press 1 to remove another movie or Enter to return to '
-                                      f'Main Menu')
-
-                if remove_choice == 2:
-                    show_instructions = True
-                    while True:
-                        if self._watchlist.get_size() == 0:
-                            print("There are no movies to remove. Your watchlist is empty.")
-                            return self.return_to_menu()
-
-                        self.print_header('Remove Movie by Title')
-                        if show_instructions:
-                            self.display_steps("remove_by_title")
-                            show_instructions = False
-
-                        print("Your Watchlist:")
-                        self._watchlist.view()
-
-                        remove_title = input("\nEnter the full title of the movie to remove"
-                                             " (or hit Enter to cancel):\n").strip().title()
-                        if remove_title.strip() == "":
-                            return self.return_to_menu()
-
-                        if not self._watchlist.contains(remove_title):
-                            print(f'No movie titled "{remove_title}" was found in your watchlist.')
-                            continue
-
-                        self.confirm_and_delete(remove_title)
-
-                        while True:
-                            remove_more = input("Would you like to remove a movie? Press 1 to remove, or hit "
-                                                "Enter to return to Main Menu\n")
-                            if remove_more == "1":
-                                break
-                            elif remove_more == "":
-                                return self.return_to_menu()
-                            else:
-                                print(f'Invalid input: Press 1 to remove another movie or Enter to return to Main Menu')
-
-                if remove_choice == 3:
-                    self.main_menu()
+            return self.remove_menu
 
         elif main_menu_choice == 4:
-            exit()
+            return self.stats_screen
+
+        elif main_menu_choice == 5:
+            return None
 
         else:
-            print("*Invalid Option. Please select from options 1-4.*")
+            print("*Invalid Option. Please select from options 1-5.*")
+            return self.main_menu
+
+    def stats_screen(self):
+        """Shows request latency, timeout and traffic metrics for both services"""
+        self.print_header('Service Stats')
+        print(format_stats(self._watchlist.service_stats()))
+        return self.return_to_menu()
+
+    def remove_menu(self):
+        """Asks how the user wants to pick the movie to remove"""
+        self.print_header('Remove Movie')
+        print("Your Watchlist:")
+        self._watchlist.view()
+
+        print("\nHow would you like to remove a movie?\n"
+              "1. By list number\n"
+              "2. By movie title\n"
+              "3. Cancel and return to main menu\n"
+              "\n"
+              "Enter your choice (1-3):")
+
+        remove_choice = None
+        while remove_choice not in [1, 2, 3]:
+            try:
+                remove_choice = int(input())
+                if remove_choice not in [1, 2, 3]:
+                    print("Invalid input: Please choose from options 1-3.")
+            except ValueError:
+                print("Invalid input: Please enter a valid number.")
+
+        if remove_choice == 1:
+            return partial(self.remove_by_number, show_instructions=True)
+        if remove_choice == 2:
+            return partial(self.remove_by_title, show_instructions=True)
+        return self.main_menu
+
+    def remove_by_number(self, show_instructions=True):
+        """Removes a movie picked by its list number"""
+        if self._watchlist.get_size() == 0:
+            print("There are no movies to remove. Your watchlist is empty.")
+            return self.return_to_menu()
+
+        self.print_header('Remove Movie by List Number')
+
+        if show_instructions:
+            self.display_steps("remove_by_num")
+
+        print("Your Watchlist:")
+        self._watchlist.view()
+
+        movie_to_remove = None
+        while movie_to_remove is None:
+            remove_input = input("\nEnter the corresponding number of the movie to remove"
+                                 " (or hit Enter to cancel):\n>")
+            if remove_input.strip() == "":
+                return self.return_to_menu()
+            try:
+                remove_num = int(remove_input)
+                if 0 < remove_num <= self._watchlist.get_size():
+                    movie_to_remove = self._watchlist.get_at_index(remove_num - 1)
+                else:
+                    print("Invalid input: No movie with that number exists.")
+            except ValueError:
+                print("Invalid Input: Please enter a valid number or hit Enter to cancel.")
+
+        next_screen = self.confirm_and_delete(movie_to_remove)
+        if next_screen is not None:
+            return next_screen
+        return self.remove_another_prompt(partial(self.remove_by_number, show_instructions=False))
+
+    def remove_by_title(self, show_instructions=True):
+        """Removes a movie picked by its title, offering close matches for partial or misspelt titles"""
+        if self._watchlist.get_size() == 0:
+            print("There are no movies to remove. Your watchlist is empty.")
+            return self.return_to_menu()
+
+        self.print_header('Remove Movie by Title')
+        if show_instructions:
+            self.display_steps("remove_by_title")
+
+        self.show_watchlist_for_search()
+
+        remove_title = input("\nEnter the title of the movie to remove"
+                             " (or hit Enter to cancel):\n").strip().title()
+        if remove_title.strip() == "":
+            return self.return_to_menu()
+
+        if not self._watchlist.contains(remove_title):
+            print(f'No movie titled "{remove_title}" was found in your watchlist.')
+            remove_title = self.pick_match(remove_title)
+            if remove_title is None:
+                return partial(self.remove_by_title, show_instructions=False)
+
+        next_screen = self.confirm_and_delete(remove_title)
+        if next_screen is not None:
+            return next_screen
+        return self.remove_another_prompt(partial(self.remove_by_title, show_instructions=False))
 
 
 def main():
+    if len(sys.argv) > 1:
+        # any arguments switch to the non-interactive command mode. cli imports this module as "main", which
+        # would run it a second time (and repeat any warning) when it was started as a script
+        sys.modules.setdefault("main", sys.modules[__name__])
+        import cli
+        sys.exit(cli.main(sys.argv[1:]))
+
     try:
         ui = UI()
-        ui.main_menu()
+        # optional periodic JSON dump of the service metrics for dashboards
+        stats_file = os.environ.get("WATCHLIST_STATS_FILE")
+        if stats_file:
+            StatsDumper(stats_file, ui._watchlist.service_stats, _stats_interval_from_environment()).start()
+        ui.run()
     except KeyboardInterrupt:
         print("Exiting")
     except Exception as e:
@@ -1,50 +1,183 @@
-import zmq
+import threading
+import uuid
+
+import reliable_request
+
+# actions that only read, so any replica can answer them
+READ_ACTIONS = ("load", "load_page")
+
+
+class WatchlistChanged(Exception):
+    """The watchlist was changed between two of the pages being read, so a title may have been skipped"""
+
+
+class PagingUnsupported(Exception):
+    """The service doesn't know the paged request, so everything has to be read in one"""
 
 
 class PersistenceClient:
-    def __init__(self, endpoint="tcp://localhost:5555"):
+    def __init__(self, endpoint="tcp://localhost:5555", timeout=1500, retries=2, pool_size=1, hedge=False):
         self.endpoint = endpoint
-        self._context = zmq.Context.instance()
-        self._socket = self._context.socket(zmq.REQ)
-        self._socket.connect(self.endpoint)
+        # last sequence number acknowledged by the service, None if the service does not support deltas
+        self.seq = None
+        # each write is based on the seq the previous one returned, so writes go one at a time
+        self._seq_lock = threading.Lock()
+        # sent with every write, so change events caused by this client can be recognised and skipped
+        self.origin = uuid.uuid4().hex
+        # seq the service reported when it last rejected a delta as stale
+        self._conflict_seq = None
+        # endpoint may be a list of replicas: reads are then spread over them and writes fail over, and
+        # hedge duplicates reads that are slower than usual to a second replica. pool_size sockets per
+        # replica let that many threads wait on the service at once.
+        self._transport = reliable_request.connect(endpoint, "persistence service", pool_size=pool_size,
+                                                   read_actions=READ_ACTIONS, hedge=hedge, timeout=timeout,
+                                                   retries=retries)
 
     def _send_request(self, data):
         """Send a request to the persistence service and wait for response."""
-        try:
-            self._socket.send_json(data)
-
-            # wait 2 seconds for response
-            if self._socket.poll(1500):
-                response = self._socket.recv_json()
-                return response
-            else:
-                return None
-        except KeyboardInterrupt:
-            raise
-        except Exception as e:
-            print(f"Error sending request to persistence service: {e}")
-            return None
+        return self._transport.request(data)
+
+    def is_healthy(self):
+        """Returns False if the latest request to the service went unanswered"""
+        return self._transport.is_healthy()
+
+    def stats(self):
+        """Returns per-action latency, timeout, error and byte counters for requests to the service"""
+        return self._transport.stats.snapshot()
 
     def close(self):
         # manually close socket connection
-        if hasattr(self, '_socket'):
-            self._socket.close()
+        if hasattr(self, '_transport'):
+            self._transport.close()
 
     def __del__(self):
         self.close()
 
     def save_watchlist(self, items):
         """Send list to microservice and return True if reply is "success" or otherwise return False"""
-        response = self._send_request({"action": "save", "version": 1, "items": items})
-        if response and response.get("status") == "success":
-            return True
-        return False
+        with self._seq_lock:
+            response = self._send_request({"action": "save", "version": 1, "items": items, "origin": self.origin})
+            if response and response.get("status") == "success":
+                self.seq = response.get("seq")
+                self._conflict_seq = None
+                return True
+            return False
 
     def load_watchlist(self):
         """Send load request to microservice and return list if reponse is "success" otherwise return None"""
-        response = self._send_request({"action": "load", "version": 1})
+        with self._seq_lock:
+            response = self._send_request({"action": "load", "version": 1})
+            if response and response.get("status") == "success":
+                items = response.get("items", [])
+                if isinstance(items, list):
+                    self.seq = response.get("seq")
+                    return items
+            return None
+
+    def load_watchlist_page(self, cursor=None, limit=1000):
+        """
+        Load one page of the watchlist. Returns (items, next_cursor, seq), next_cursor is None on the last page.
+        Returns None if the request failed and raises PagingUnsupported if the service can't page.
+        """
+        request = {"action": "load_page", "version": 1, "cursor": cursor, "limit": limit}
+        if cursor is not None:
+            return self._page(self._send_request(request))
+        # deltas are based on the list as of the first page, so its seq is taken in turn with the writes'
+        with self._seq_lock:
+            page = self._page(self._send_request(request))
+            if page is not None:
+                self.seq = page[2]
+            return page
+
+    @staticmethod
+    def _page(response):
+        if response and response.get("status") == "error" and \
+                str(response.get("message", "")).startswith("Unknown action"):
+            raise PagingUnsupported("persistence service does not support paging")
         if response and response.get("status") == "success":
             items = response.get("items", [])
             if isinstance(items, list):
-                return items
+                return items, response.get("next_cursor"), response.get("seq")
         return None
+
+    def iter_watchlist_pages(self, limit=1000):
+        """
+        Yields the watchlist one page at a time, or as a single page from a service that can't page.
+        Raises ConnectionError if the service stops answering part way through, and WatchlistChanged if the
+        seq of a page differs from the first one's, as the pages then don't add up to one version of the list.
+        """
+        cursor = None
+        first_seq = None
+        while True:
+            try:
+                page = self.load_watchlist_page(cursor, limit)
+            except PagingUnsupported:
+                items = self.load_watchlist()
+                if items is None:
+                    raise ConnectionError("persistence service not responding")
+                yield items
+                return
+            if page is None:
+                raise ConnectionError("persistence service not responding")
+            if cursor is None:
+                first_seq = page[2]
+            elif page[2] != first_seq:
+                raise WatchlistChanged(f"watchlist changed from seq {first_seq} to {page[2]} while paging")
+            items, cursor, seq = page
+            yield items
+            if cursor is None:
+                return
+
+    def supports_delta(self):
+        """Returns True if the service reported a sequence number, meaning add_items/remove_items can be used"""
+        return self.seq is not None
+
+    def add_items(self, items):
+        """Send only the added titles. Returns False if the request failed or our sequence number is stale."""
+        return self._send_delta("add_items", items)
+
+    def remove_items(self, items):
+        """Send only the removed titles. Returns False if the request failed or our sequence number is stale."""
+        return self._send_delta("remove_items", items)
+
+    def _send_delta(self, action, items):
+        """Send a delta operation based on the last known sequence number and record the new one."""
+        with self._seq_lock:
+            if self.seq is None:
+                return False
+            response = self._send_request({"action": action, "version": 1, "seq": self.seq, "items": items,
+                                           "origin": self.origin})
+            if response and response.get("status") == "success":
+                self.seq = response.get("seq")
+                return True
+            if response and response.get("status") == "conflict":
+                self._conflict_seq = response.get("seq")
+            return False
+
+    def rebase(self):
+        """
+        Moves on to the seq the service reported when it last rejected a delta, so the delta can be resent.
+        Returns False if no delta was rejected. Changes made in between have to be reloaded by the caller.
+        """
+        with self._seq_lock:
+            if self._conflict_seq is None:
+                return False
+            self.seq = self._conflict_seq
+            self._conflict_seq = None
+            return True
+
+    def accept_change(self, seq):
+        """
+        Checks the seq of a change another client published against ours.
+        Returns "apply" for the next change (and takes its seq), "seen" for one the last load or write
+        already covered, or "missed" if changes were skipped and the watchlist has to be reloaded.
+        """
+        with self._seq_lock:
+            if seq is None or self.seq is None:
+                return "apply"
+            if seq <= self.seq:
+                return "seen"
+            if seq == self.seq + 1:
+                self.seq = seq
+                return "apply"
+            return "missed"
@@ -0,0 +1,115 @@
+import argparse
+import json
+import os
+
+import wire_format
+from change_feed import WATCHLIST_TOPIC
+from request_server import RequestServer
+from titles import title_key
+
+
+class PersistenceServer(RequestServer):
+    """Local stand-in for the persistence microservice, for offline testing.
+
+    Speaks the same protocol as the real service (load/save) plus the delta
+    operations (add_items/remove_items) keyed by a sequence number that is
+    bumped on every change. With a publish_endpoint every change is also
+    published as a "watchlist" event carrying the titles added and removed,
+    the new seq and the "origin" the writing client tagged its request with.
+    """
+
+    name = "Persistence"
+    topic = WATCHLIST_TOPIC
+
+    def __init__(self, endpoint="tcp://*:5555", data_file=None, publish_endpoint=None):
+        super().__init__(endpoint, publish_endpoint)
+        self.data_file = data_file
+        self.items = []
+        self.seq = 0
+        self._load_file()
+
+    def _load_file(self):
+        """Load saved items from the data file if one was given and exists"""
+        if self.data_file and os.path.exists(self.data_file):
+            with open(self.data_file) as f:
+                data = json.load(f)
+            self.items = data.get("items", [])
+            self.seq = data.get("seq", 0)
+
+    def _save_file(self):
+        """Write the items to the data file if one was given"""
+        if self.data_file:
+            with open(self.data_file, "w") as f:
+                json.dump({"items": self.items, "seq": self.seq}, f)
+
+    def _changed(self, request, added, removed):
+        """Bump the sequence number, store the change and queue its event"""
+        self.seq += 1
+        self._save_file()
+        self._outbox.append({"event": "changed", "seq": self.seq, "origin": request.get("origin"),
+                             "added": added, "removed": removed})
+        return {"status": "success", "seq": self.seq}
+
+    @staticmethod
+    def _page_bounds(request):
+        """Returns (offset, limit) for a paged request, the cursor is the offset as a string"""
+        offset = int(request.get("cursor") or 0)
+        limit = max(1, int(request.get("limit") or 1000))
+        return offset, limit
+
+    def handle(self, request):
+        """Returns the response for a single request"""
+        action = request.get("action")
+
+        if action == "negotiate":
+            return {"status": "success", "version": wire_format.choose_version(request.get("versions", []))}
+
+        if action == "load":
+            return {"status": "success", "items": list(self.items), "seq": self.seq}
+
+        if action == "load_page":
+            offset, limit = self._page_bounds(request)
+            items = self.items[offset:offset + limit]
+            next_cursor = str(offset + limit) if offset + limit < len(self.items) else None
+            return {"status": "success", "items": items, "next_cursor": next_cursor, "seq": self.seq}
+
+        if action == "save":
+            items = request.get("items")
+            if not isinstance(items, list):
+                return {"status": "error", "message": "items must be a list"}
+            old_keys = {title_key(item) for item in self.items}
+            new_keys = {title_key(item) for item in items}
+            added = [item for item in items if title_key(item) not in old_keys]
+            removed = [item for item in self.items if title_key(item) not in new_keys]
+            self.items = list(items)
+            return self._changed(request, added, removed)
+
+        if action in ("add_items", "remove_items"):
+            if request.get("seq") != self.seq:
+                return {"status": "conflict", "seq": self.seq}
+            items = request.get("items", [])
+            if action == "add_items":
+                known = {title_key(item) for item in self.items}
+                added = [item for item in items if title_key(item) not in known]
+                self.items.extend(added)
+                return self._changed(request, added, [])
+            removed_keys = {title_key(item) for item in items}
+            removed = [item for item in self.items if title_key(item) in removed_keys]
+            self.items = [item for item in self.items if title_key(item) not in removed_keys]
+            return self._changed(request, [], removed)
+
+        return {"status": "error", "message": f"Unknown action: {action}"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the watchlist persistence service")
+    parser.add_argument("--endpoint", default="tcp://*:5555")
+    parser.add_argument("--data-file", default=None, help="JSON file to keep the watchlist in between runs")
+    parser.add_argument("--publish-endpoint", default="tcp://*:5556",
+                        help="where to publish change events, empty to turn them off")
+    args = parser.parse_args()
+    PersistenceServer(args.endpoint, args.data_file, args.publish_endpoint or None).serve()
+
+
+if __name__ == "__main__":
+    main()
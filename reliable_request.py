@@ -0,0 +1,381 @@
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+import zmq
+
+import wire_format
+from request_stats import RequestStats
+
+
+class EndpointHealth:
+    """Tracks how an endpoint has been answering recently."""
+
+    def __init__(self):
+        self.consecutive_failures = 0
+        self.last_success = None
+        self.last_failure = None
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.last_success = time.monotonic()
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self.last_failure = time.monotonic()
+
+    def is_healthy(self):
+        """An endpoint is healthy once it has answered and its latest request did not fail"""
+        return self.last_success is not None and self.consecutive_failures == 0
+
+
+class ReliableRequester:
+    """Request/reply over a REQ socket using the "lazy pirate" pattern.
+
+    A REQ socket that timed out waiting for a reply can't send again, so on
+    timeout the socket is closed and reconnected before retrying. Retries back
+    off exponentially and stop once the timeout budget is used up. An endpoint
+    that is failing gets a single attempt per request, until probe_after
+    seconds have passed since its last failure: the next request is then a
+    probe with the full retries, so a brief outage doesn't leave it on one.
+
+    Before the first request the wire encoding is negotiated with a
+    "negotiate" action: if both sides have msgpack, requests are sent as
+    msgpack with "version": 2, otherwise as JSON with "version": 1.
+    """
+
+    def __init__(self, endpoint, service_name="service", timeout=1500, retries=2, backoff=0.1,
+                 timeout_budget=None, health=None, stats=None, probe_after=5.0):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.probe_after = probe_after
+        # total milliseconds a single request may spend across all attempts
+        self.timeout_budget = timeout_budget if timeout_budget is not None else timeout * (retries + 1)
+        # health and stats can be shared by the requesters of a pool
+        self.health = health if health is not None else EndpointHealth()
+        self.stats = stats if stats is not None else RequestStats()
+        # wire version agreed with the service, None until negotiated
+        self.wire_version = None if len(wire_format.supported_versions()) > 1 else wire_format.JSON_VERSION
+        self._context = zmq.Context.instance()
+        self._socket = None
+        self._connect()
+
+    def _connect(self):
+        self._socket = self._context.socket(zmq.REQ)
+        self._socket.setsockopt(zmq.LINGER, 0)
+        self._socket.connect(self.endpoint)
+
+    def _reset(self):
+        """Throw away a socket stuck waiting for a reply and open a fresh one"""
+        self._socket.close()
+        self._connect()
+
+    def request(self, data):
+        """Send a request and return the decoded reply, or None if the service didn't answer in time."""
+        if self.wire_version is None and not self._negotiate():
+            return None
+        response = self._exchange({**data, "version": self.wire_version}, self.wire_version)
+        if response is None and len(wire_format.supported_versions()) > 1:
+            # the service may have been replaced by one that speaks another version
+            self.wire_version = None
+        return response
+
+    def _negotiate(self):
+        """Agrees on a wire version with the service. Services that don't know "negotiate" get JSON."""
+        response = self._exchange({"action": "negotiate", "version": wire_format.JSON_VERSION,
+                                   "versions": wire_format.supported_versions()}, wire_format.JSON_VERSION)
+        if response is None:
+            return False
+        self.wire_version = wire_format.JSON_VERSION
+        if response.get("status") == "success":
+            self.wire_version = wire_format.choose_version([response.get("version")])
+        return True
+
+    def _exchange(self, data, version):
+        """Sends one request with retries, encoded for the given wire version"""
+        # an endpoint that is failing (or never answered) only gets one attempt, so a dead service doesn't
+        # stall every call, but once probe_after has passed a request tries it with every retry again
+        attempts = self.retries + 1 if self.health.is_healthy() or self._probe_due() else 1
+        deadline = time.monotonic() + self.timeout_budget / 1000
+        delay = self.backoff
+
+        action = data.get("action", "unknown")
+        started = time.perf_counter()
+        sent = received = timeouts = errors = 0
+        response = None
+
+        for attempt in range(attempts):
+            remaining = int((deadline - time.monotonic()) * 1000)
+            if remaining <= 0:
+                break
+            try:
+                frame = wire_format.encode(data, version)
+                self._socket.send(frame)
+                sent += len(frame)
+                if self._socket.poll(min(self.timeout, remaining)):
+                    frame = self._socket.recv()
+                    received += len(frame)
+                    response = wire_format.decode(frame)
+                    break
+                timeouts += 1
+            except KeyboardInterrupt:
+                raise
+            except Exception as e:
+                errors += 1
+                print(f"Error sending request to {self.service_name}: {e}")
+
+            self._reset()
+            if attempt < attempts - 1:
+                time.sleep(delay)
+                delay *= 2
+
+        self.stats.record(action, (time.perf_counter() - started) * 1000, sent, received, timeouts, errors,
+                          ok=response is not None)
+        if response is None:
+            self.health.record_failure()
+        else:
+            self.health.record_success()
+        return response
+
+    def _probe_due(self):
+        last_failure = self.health.last_failure
+        return last_failure is not None and time.monotonic() - last_failure >= self.probe_after
+
+    def is_healthy(self):
+        return self.health.is_healthy()
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+
+class RequesterPool:
+    """A pool of ReliableRequesters for one endpoint, so several threads can have requests in flight.
+
+    A REQ socket allows only one outstanding request and must not be used
+    from two threads at once, so every request checks a requester out of the
+    pool and checks it back in when the reply (or timeout) is in. Up to size
+    sockets are opened on demand on the shared zmq context; callers beyond
+    that wait for one to come back, for at most a request's timeout budget,
+    and fail the request if none does. The requesters share the pool's health
+    and stats, and new ones start with the wire version already negotiated.
+    """
+
+    def __init__(self, endpoint, service_name="service", size=4, **options):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.size = size
+        self.options = options
+        # seconds to wait for a socket when all are checked out, as long as a request may take itself
+        timeout = options.get("timeout", 1500)
+        budget = options.get("timeout_budget")
+        self.wait_timeout = (budget if budget is not None else timeout * (options.get("retries", 2) + 1)) / 1000
+        self.health = EndpointHealth()
+        self.stats = RequestStats()
+        # most recently used first, so a lightly loaded pool keeps reusing the same warm sockets
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._wire_version = None
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def _take(self):
+        """Returns an idle requester, or a new one while the pool isn't full. None if none came back in time."""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self._created < self.size
+            if create:
+                self._created += 1
+        if not create:
+            try:
+                return self._idle.get(timeout=self.wait_timeout)
+            except queue.Empty:
+                return None
+        try:
+            requester = ReliableRequester(self.endpoint, self.service_name, health=self.health, stats=self.stats,
+                                          **self.options)
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+        if self._wire_version is not None:
+            requester.wire_version = self._wire_version
+        return requester
+
+    def _give_back(self, requester):
+        if requester.wire_version is not None:
+            self._wire_version = requester.wire_version
+        with self._lock:
+            if self._closed:
+                requester.close()
+                return
+        self._idle.put(requester)
+
+    @contextmanager
+    def checkout(self):
+        """
+        Lends a requester to the caller's thread, for sending several requests over one socket.
+        Yields None if every requester stayed checked out for wait_timeout.
+        """
+        requester = self._take()
+        try:
+            yield requester
+        finally:
+            if requester is not None:
+                self._give_back(requester)
+
+    def request(self, data):
+        """Sends a request on an idle socket, see ReliableRequester.request()"""
+        started = time.perf_counter()
+        with self.checkout() as requester:
+            if requester is None:
+                # the service isn't to blame for our own sockets being busy, so its health is left alone
+                self.stats.record(data.get("action", "unknown"), (time.perf_counter() - started) * 1000, 0, 0,
+                                  timeouts=1, ok=False)
+                return None
+            return requester.request(data)
+
+    def has_idle(self):
+        """True if a request could start straight away instead of waiting for a socket"""
+        return not self._idle.empty() or self._created < self.size
+
+    def is_healthy(self):
+        return self.health.is_healthy()
+
+    def close(self):
+        """Closes the idle sockets now and the checked out ones as they come back"""
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class ReplicaSet:
+    """Requests spread over several replicas of a service, each with its own RequesterPool.
+
+    Reads (the actions in read_actions) go round-robin to the replicas that
+    haven't failed recently, skipping ahead of replicas whose sockets are all
+    busy. Everything else goes to the first such replica
+    in the given order, the primary, and fails over to the next one if it
+    doesn't answer. A replica that failed is skipped for retry_after seconds,
+    unless all of them have failed.
+
+    With hedge, a read that gets no reply within that replica's observed p95
+    latency for the action is also sent to a second replica, and whichever
+    answers first wins.
+    """
+
+    # requests of an action a replica has to have served before its p95 is trusted for hedging
+    MIN_HEDGE_SAMPLES = 20
+
+    def __init__(self, endpoints, service_name="service", read_actions=(), hedge=False, retry_after=5.0,
+                 pool_size=1, **options):
+        self.endpoints = list(endpoints)
+        self.service_name = service_name
+        self.read_actions = set(read_actions)
+        self.hedge = hedge
+        self.retry_after = retry_after
+        self.replicas = [RequesterPool(endpoint, service_name, size=pool_size, **options)
+                         for endpoint in self.endpoints]
+        self._next_read = itertools.count()
+        self._executor = ThreadPoolExecutor(max_workers=2 * len(self.replicas) * pool_size) if hedge else None
+
+    @property
+    def stats(self):
+        """Request metrics of all replicas combined"""
+        return RequestStats.merged(replica.stats for replica in self.replicas)
+
+    def _available(self, replica):
+        health = replica.health
+        return health.consecutive_failures == 0 or time.monotonic() - health.last_failure >= self.retry_after
+
+    def _ordered(self, read):
+        """Replicas to try in order: the available ones then the rest. Reads rotate and prefer idle replicas."""
+        available = [replica for replica in self.replicas if self._available(replica)]
+        if read and available:
+            shift = next(self._next_read) % len(available)
+            available = available[shift:] + available[:shift]
+            # a replica with every socket waiting on a reply would only queue the read
+            available.sort(key=lambda replica: not replica.has_idle())
+        return available + [replica for replica in self.replicas if replica not in available]
+
+    def request(self, data):
+        """Sends a request to the replicas in turn until one answers, returns None if none did"""
+        read = data.get("action") in self.read_actions
+        replicas = self._ordered(read)
+        if read and self.hedge and len(replicas) > 1:
+            return self._hedged_request(data, replicas)
+        for replica in replicas:
+            response = replica.request(data)
+            if response is not None:
+                return response
+        return None
+
+    def _hedged_request(self, data, replicas):
+        first, second, *rest = replicas
+        action = data.get("action")
+        delay = None
+        if first.stats.requests(action) >= self.MIN_HEDGE_SAMPLES:
+            delay = first.stats.percentile(0.95, action)
+        if delay is None:
+            # no latency history yet, so behave like an ordinary read
+            for replica in replicas:
+                response = replica.request(data)
+                if response is not None:
+                    return response
+            return None
+
+        futures = {self._executor.submit(first.request, data)}
+        remaining = [second] + rest
+        done, _ = wait(futures, timeout=delay / 1000)
+        if not done:
+            # the first replica is slower than usual, race it against a second one
+            futures.add(self._executor.submit(second.request, data))
+            remaining = rest
+        while futures:
+            done, futures = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                response = future.result()
+                if response is not None:
+                    return response
+        for replica in remaining:
+            response = replica.request(data)
+            if response is not None:
+                return response
+        return None
+
+    def is_healthy(self):
+        return any(replica.is_healthy() for replica in self.replicas)
+
+    def close(self):
+        for replica in self.replicas:
+            replica.close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+def connect(endpoint, service_name, pool_size=1, read_actions=(), hedge=False, **options):
+    """
+    Returns the transport for one endpoint, or for a list of replica endpoints.
+    Both send requests with request(data) and report is_healthy() and stats.
+    """
+    if isinstance(endpoint, str):
+        return RequesterPool(endpoint, service_name, size=pool_size, **options)
+    endpoints = list(endpoint)
+    if len(endpoints) == 1:
+        return RequesterPool(endpoints[0], service_name, size=pool_size, **options)
+    return ReplicaSet(endpoints, service_name, read_actions=read_actions, hedge=hedge, pool_size=pool_size,
+                      **options)
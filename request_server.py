@@ -0,0 +1,69 @@
+import zmq
+
+import wire_format
+from change_feed import ChangePublisher
+
+
+class RequestServer:
+    """Request loop shared by the local stand-in services.
+
+    Answers each request on a REP socket with handle(request), in the
+    encoding the request came in and echoing its request_id, and turns a
+    request that fails into an error reply so the server keeps serving.
+    Events a handler queues with its _outbox are published under topic
+    once the reply is sent, if a publish_endpoint was given.
+    """
+
+    # the service's name in the startup banner
+    name = "Request"
+    # topic the change events are published under
+    topic = None
+
+    def __init__(self, endpoint, publish_endpoint=None):
+        self.endpoint = endpoint
+        self.publish_endpoint = publish_endpoint
+        # events of the request being handled, published once its reply is sent
+        self._outbox = []
+
+    def handle(self, request):
+        """Returns the response for a single request"""
+        raise NotImplementedError
+
+    def _respond(self, frame):
+        """Returns the encoded reply to a request frame"""
+        self._outbox = []
+        request = {}
+        try:
+            request = wire_format.decode(frame)
+            response = self.handle(request)
+        except Exception as e:
+            # a malformed request gets an error reply, REP has to answer and the server keeps serving
+            print(f"Error handling request: {e}")
+            response = {"status": "error", "message": f"Bad request: {e}"}
+            self._outbox = []
+            if not isinstance(request, dict):
+                request = {}
+        # echo the id so pipelining (DEALER) clients can match replies to requests
+        if "request_id" in request:
+            response["request_id"] = request["request_id"]
+        # answer in the encoding the request came in
+        return wire_format.encode(response, request.get("version", wire_format.JSON_VERSION))
+
+    def serve(self):
+        """Answer requests on a REP socket until interrupted"""
+        socket = zmq.Context.instance().socket(zmq.REP)
+        socket.bind(self.endpoint)
+        publisher = ChangePublisher(self.publish_endpoint) if self.publish_endpoint else None
+        print(f"{self.name} server listening on {self.endpoint}")
+        try:
+            while True:
+                socket.send(self._respond(socket.recv()))
+                if publisher is not None:
+                    for event in self._outbox:
+                        publisher.publish(self.topic, event)
+        except KeyboardInterrupt:
+            print("Exiting")
+        finally:
+            socket.close(linger=0)
+            if publisher is not None:
+                publisher.close()
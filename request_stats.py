@@ -0,0 +1,172 @@
+import json
+import os
+import threading
+import time
+
+# upper bounds (ms) of the latency histogram buckets, anything slower lands in a final overflow bucket
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 1500, 2500, 5000)
+
+
+class ActionStats:
+    """Counters and latency histogram for one request action"""
+
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def percentile(self, fraction):
+        """Estimates a latency percentile as the upper bound of the bucket it falls in"""
+        if self.requests == 0:
+            return None
+        target = fraction * self.requests
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets):
+            seen += count
+            if seen >= target:
+                return round(min(bound, self.max_ms), 3)
+        return round(self.max_ms, 3)
+
+    def merge(self, other):
+        """Adds another ActionStats' counts into this one"""
+        self.requests += other.requests
+        self.failures += other.failures
+        self.timeouts += other.timeouts
+        self.errors += other.errors
+        self.bytes_sent += other.bytes_sent
+        self.bytes_received += other.bytes_received
+        self.total_ms += other.total_ms
+        self.max_ms = max(self.max_ms, other.max_ms)
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+
+    def to_dict(self):
+        return {
+            "requests": self.requests,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "mean_ms": round(self.total_ms / self.requests, 3) if self.requests else None,
+            "p50_ms": self.percentile(0.50),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": round(self.max_ms, 3),
+            "histogram_ms": dict(zip([str(bound) for bound in LATENCY_BUCKETS_MS] + ["inf"], self.buckets)),
+        }
+
+
+class RequestStats:
+    """Per-action request metrics for one service endpoint"""
+
+    def __init__(self):
+        self._actions = {}
+        self._lock = threading.Lock()
+
+    def record(self, action, latency_ms, bytes_sent, bytes_received, timeouts=0, errors=0, ok=True):
+        """Records one request, including all of its retries"""
+        with self._lock:
+            stats = self._actions.setdefault(action, ActionStats())
+            stats.requests += 1
+            stats.failures += 0 if ok else 1
+            stats.timeouts += timeouts
+            stats.errors += errors
+            stats.bytes_sent += bytes_sent
+            stats.bytes_received += bytes_received
+            stats.total_ms += latency_ms
+            stats.max_ms = max(stats.max_ms, latency_ms)
+            for index, bound in enumerate(LATENCY_BUCKETS_MS):
+                if latency_ms <= bound:
+                    stats.buckets[index] += 1
+                    break
+            else:
+                stats.buckets[-1] += 1
+
+    def percentile(self, fraction, action=None):
+        """Estimated latency percentile for one action, or across all actions"""
+        with self._lock:
+            if action is not None:
+                stats = self._actions.get(action)
+                return stats.percentile(fraction) if stats else None
+            combined = ActionStats()
+            for stats in self._actions.values():
+                combined.merge(stats)
+            return combined.percentile(fraction)
+
+    def requests(self, action):
+        """Number of requests recorded for an action"""
+        with self._lock:
+            stats = self._actions.get(action)
+            return stats.requests if stats else 0
+
+    @classmethod
+    def merged(cls, all_stats):
+        """Returns a RequestStats combining several, e.g. those of each replica of a service"""
+        combined = cls()
+        for stats in all_stats:
+            with stats._lock:
+                for action, action_stats in stats._actions.items():
+                    combined._actions.setdefault(action, ActionStats()).merge(action_stats)
+        return combined
+
+    def snapshot(self):
+        """Returns all metrics as a JSON-serialisable dict keyed by action"""
+        with self._lock:
+            return {action: stats.to_dict() for action, stats in sorted(self._actions.items())}
+
+
+def format_stats(service_stats):
+    """Formats {service name: snapshot} as a text table"""
+    lines = []
+    for service, actions in service_stats.items():
+        lines.append(f"{service}:")
+        if not actions:
+            lines.append("  no requests yet")
+            continue
+        lines.append(f"  {'action':<24}{'requests':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+                     f"{'timeouts':>9}{'errors':>8}{'sent':>11}{'received':>11}")
+        for action, stats in actions.items():
+            lines.append(f"  {action:<24}{stats['requests']:>9}{_ms(stats['p50_ms']):>9}{_ms(stats['p95_ms']):>9}"
+                         f"{_ms(stats['p99_ms']):>9}{stats['timeouts']:>9}{stats['errors']:>8}"
+                         f"{stats['bytes_sent']:>11}{stats['bytes_received']:>11}")
+    return "\n".join(lines)
+
+
+def _ms(value):
+    return "-" if value is None else f"{value:.1f}"
+
+
+class StatsDumper:
+    """Writes get_stats() as JSON to a file every interval seconds, for dashboards to pick up"""
+
+    def __init__(self, path, get_stats, interval=10.0):
+        self.path = path
+        self.get_stats = get_stats
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.dump()
+
+    def dump(self):
+        """Writes the current stats now, replacing the file atomically"""
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"timestamp": time.time(), "services": self.get_stats()}, f, indent=2)
+        os.replace(temp_path, self.path)
+
+    def stop(self):
+        self._stopped.set()
+        self.dump()
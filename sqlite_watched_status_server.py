@@ -0,0 +1,173 @@
+import argparse
+import json
+import sqlite3
+from datetime import date
+
+from titles import title_key
+from watched_status_server import WatchedStatusServer
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS movies (
+    title_key TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL,
+    watched INTEGER NOT NULL DEFAULT 0,
+    rating,
+    watch_date TEXT
+)
+"""
+
+# keeps the first spelling of a title, later marks only change its status like the in-memory server
+SET_STATUS = """
+INSERT INTO movies (title_key, title, watched, rating, watch_date)
+VALUES (:title_key, :title, :watched, :rating, COALESCE(:watch_date, :default_date))
+ON CONFLICT (title_key) DO UPDATE SET
+    watched = excluded.watched,
+    rating = COALESCE(excluded.rating, rating),
+    watch_date = COALESCE(:watch_date, watch_date, :default_date)
+RETURNING title, watched, rating, watch_date
+"""
+
+# one indexed lookup per title of the list, returning the positions of those with the wanted status
+FILTER_LIST = """
+SELECT listed.key FROM json_each(:keys) AS listed
+LEFT JOIN movies ON movies.title_key = listed.value
+WHERE COALESCE(movies.watched, 0) = :watched
+ORDER BY listed.key
+"""
+
+STATUS_OF_LIST = """
+SELECT listed.key, movies.title, movies.watched, movies.rating, movies.watch_date FROM json_each(:keys) AS listed
+LEFT JOIN movies ON movies.title_key = listed.value
+ORDER BY listed.key
+"""
+
+
+class SqliteWatchedStatusServer(WatchedStatusServer):
+    """Reference watched status service that keeps its data in SQLite.
+
+    Speaks the same protocol as WatchedStatusServer. Titles are looked up
+    through a unique index on their title_key() (folded in Python, as SQLite's
+    NOCASE only folds ASCII), so filtering a list is a single query
+    joining the list, passed as a JSON array, to that index. The database runs
+    in WAL mode so a reader such as a backup never blocks the server's writes.
+    """
+
+    WRITE_ACTIONS = ("mark_watched", "mark_unwatched", "mark_watched_many")
+
+    def __init__(self, endpoint="tcp://*:5557", db_path="watched_status.db", publish_endpoint=None):
+        super().__init__(endpoint, publish_endpoint)
+        self.db_path = db_path
+        # serve() runs on its own thread in the stub services, but it is the only one using the connection
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        # with WAL a commit survives a crash of the process, NORMAL only risks the latest ones on power loss
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(SCHEMA)
+        self.db.commit()
+
+    @staticmethod
+    def _movie(title, watched, rating, watch_date):
+        return {"title": title, "watched": bool(watched), "rating": rating, "watch_date": watch_date}
+
+    def _is_watched(self, title):
+        row = self.db.execute("SELECT watched FROM movies WHERE title_key = ?", (title_key(title),)).fetchone()
+        return row is not None and bool(row[0])
+
+    def _status(self, title):
+        row = self.db.execute("SELECT title, watched, rating, watch_date FROM movies WHERE title_key = ?",
+                              (title_key(title),)).fetchone()
+        if row is None:
+            return self._movie(title, False, None, None)
+        return self._movie(*row)
+
+    def _set_status(self, fields, watched):
+        title = fields["title"]
+        row = self.db.execute(SET_STATUS, {
+            "title_key": title_key(title),
+            "title": title,
+            "watched": watched,
+            "rating": fields.get("rating"),
+            "watch_date": (fields.get("watch_date") or None) if watched else fields.get("watch_date"),
+            "default_date": date.today().isoformat() if watched else None
+        }).fetchone()
+        return self._movie(*row)
+
+    def _filter(self, movie_list, watched):
+        """Returns the titles of movie_list with the given watch status, in list order"""
+        keys = json.dumps([title_key(title) for title in movie_list])
+        return [movie_list[position] for position, in self.db.execute(FILTER_LIST,
+                                                                      {"keys": keys, "watched": int(watched)})]
+
+    def _statuses(self, titles):
+        keys = json.dumps([title_key(title) for title in titles])
+        return [self._movie(*row[1:]) if row[1] is not None else self._movie(titles[row[0]], False, None, None)
+                for row in self.db.execute(STATUS_OF_LIST, {"keys": keys})]
+
+    def _movies(self, after=0, limit=-1):
+        """Returns (rowid, status) of the stored movies in the order they were first marked"""
+        rows = self.db.execute("SELECT rowid, title, watched, rating, watch_date FROM movies WHERE rowid > ? "
+                               "ORDER BY rowid LIMIT ?", (after, limit))
+        return [(row[0], self._movie(*row[1:])) for row in rows]
+
+    def handle(self, request):
+        action = request.get("action")
+
+        if action in self.WRITE_ACTIONS:
+            # a batch is committed as one transaction
+            with self.db:
+                return super().handle(request)
+
+        if action == "get_status_many":
+            return {"status": "success", "statuses": self._statuses(request.get("titles", []))}
+
+        if action == "get_all_movies":
+            return {"status": "success", "movies": [movie for rowid, movie in self._movies()]}
+
+        if action == "get_all_movies_page":
+            # the cursor is the rowid of the last movie sent, so a page is a range scan of the primary key
+            after = int(request.get("cursor") or 0)
+            limit = max(1, int(request.get("limit") or 1000))
+            page = self._movies(after, limit + 1)
+            next_cursor = str(page[limit - 1][0]) if len(page) > limit else None
+            return {"status": "success", "movies": [movie for rowid, movie in page[:limit]],
+                    "next_cursor": next_cursor}
+
+        if action == "get_unwatched_from_list":
+            return {"status": "success", "unwatched_movies": self._filter(request.get("movie_list", []), False)}
+
+        if action == "get_watched_from_list":
+            return {"status": "success", "watched_movies": self._filter(request.get("movie_list", []), True)}
+
+        if action == "filter_by_handle":
+            movie_list = self.lists.get(request.get("handle"))
+            if movie_list is None:
+                return {"status": "error", "message": "Unknown handle"}
+            return {"status": "success",
+                    "filtered_movies": self._filter(movie_list, request.get("watched", True))}
+
+        if action == "filter_by_status":
+            return {"status": "success",
+                    "filtered_movies": self._filter(request.get("movie_list", []), request.get("watched", True))}
+
+        return super().handle(request)
+
+    def close(self):
+        self.db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Watched status service backed by SQLite")
+    parser.add_argument("--endpoint", default="tcp://*:5557")
+    parser.add_argument("--db", default="watched_status.db", help="SQLite database file, created if missing")
+    parser.add_argument("--publish-endpoint", default="tcp://*:5558",
+                        help="where to publish change events, empty to turn them off")
+    args = parser.parse_args()
+    server = SqliteWatchedStatusServer(args.endpoint, args.db, args.publish_endpoint or None)
+    try:
+        server.serve()
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+
+from titles import title_key
+
+
+class StatusCache:
+    """Client-side cache of movie watch statuses, keyed by title_key().
+
+    Entries expire after ttl seconds and the least recently used entry is
+    evicted once max_entries is reached. After load_all() the cache also knows
+    the service's full movie list, so titles missing from it can be answered
+    as unwatched without asking the service, until that snapshot expires or an
+    entry is evicted.
+    """
+
+    def __init__(self, ttl=60.0, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._complete_until = 0
+        self._load_intact = False
+        self._load_started = 0
+        self._lock = threading.Lock()
+
+    def _get_entry(self, key, now):
+        """Returns the fresh status stored under key, moving it to the most recently used end"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, status = entry
+        if expires_at <= now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return status
+
+    def _put_entry(self, key, status, now):
+        self._entries[key] = (now + self.ttl, status)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            # an evicted movie would now look unwatched, so the full snapshot can't be trusted any more
+            self._complete_until = 0
+            self._load_intact = False
+
+    def _snapshot_is_fresh(self, now):
+        return self._complete_until > now
+
+    def get(self, title):
+        """Returns the cached status dict for a title, or None if it has to be fetched"""
+        now = time.monotonic()
+        with self._lock:
+            status = self._get_entry(title_key(title), now)
+            if status is None and self._snapshot_is_fresh(now):
+                status = {"title": title, "watched": False, "rating": None, "watch_date": None}
+            if status is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return status
+
+    def get_many(self, titles):
+        """Returns cached statuses for every title in order, or None if any of them has to be fetched"""
+        statuses = []
+        for title in titles:
+            status = self.get(title)
+            if status is None:
+                return None
+            statuses.append(status)
+        return statuses
+
+    def put(self, title, **status):
+        """Stores or updates the status of a title, keeping fields that were not given"""
+        now = time.monotonic()
+        key = title_key(title)
+        with self._lock:
+            current = self._get_entry(key, now) or {"title": title, "watched": False, "rating": None,
+                                                    "watch_date": None}
+            self._put_entry(key, {**current, **status}, now)
+
+    def update(self, title, watched, rating=None, watch_date=None):
+        """
+        Applies a mark_watched/mark_unwatched the way the service does: fields that are None are kept, and a
+        watched movie without a watch date gets today's. A title whose current status isn't cached is left
+        out, as the service may hold a rating or date this cache doesn't know.
+        """
+        now = time.monotonic()
+        key = title_key(title)
+        with self._lock:
+            current = self._get_entry(key, now)
+            if current is None and self._snapshot_is_fresh(now):
+                current = {"title": title, "watched": False, "rating": None, "watch_date": None}
+            if current is None:
+                return
+            status = {**current, "watched": watched}
+            if rating is not None:
+                status["rating"] = rating
+            if watch_date is not None:
+                status["watch_date"] = watch_date
+            elif watched and status["watch_date"] is None:
+                status["watch_date"] = date.today().isoformat()
+            self._put_entry(key, status, now)
+
+    def load_all(self, movies):
+        """Replaces the cache with the service's full movie list"""
+        self.begin_load()
+        self.add_loaded(movies)
+        self.finish_load()
+
+    def begin_load(self):
+        """Starts replacing the cache with the service's full movie list, delivered by add_loaded()"""
+        with self._lock:
+            self._entries.clear()
+            self._complete_until = 0
+            self._load_intact = True
+            self._load_started = time.monotonic()
+
+    def add_loaded(self, movies):
+        """Adds one page of the full movie list"""
+        now = time.monotonic()
+        with self._lock:
+            for movie in movies:
+                title = movie.get("title")
+                if not title:
+                    self._load_intact = False
+                    continue
+                self._put_entry(title_key(title), {"title": title, "watched": movie.get("watched", False),
+                                                "rating": movie.get("rating"),
+                                                "watch_date": movie.get("watch_date")}, now)
+
+    def finish_load(self):
+        """Marks the cache as holding the full movie list, unless entries were dropped while loading"""
+        with self._lock:
+            if self._load_intact:
+                # the first page's entries expire first, the snapshot can't outlive them
+                self._complete_until = self._load_started + self.ttl
+
+    def all_movies(self):
+        """Returns every cached movie if the full snapshot is still fresh, otherwise None"""
+        now = time.monotonic()
+        with self._lock:
+            if not self._snapshot_is_fresh(now):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return [dict(status) for expires_at, status in self._entries.values() if expires_at > now]
+
+    def invalidate(self, title=None):
+        """Drops one title, or everything when no title is given"""
+        with self._lock:
+            self._complete_until = 0
+            self._load_intact = False
+            if title is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(title_key(title), None)
+
+    def stats(self):
+        """Returns the hit/miss counters and current size"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
@@ -0,0 +1,40 @@
+import threading
+import time
+
+from persistence_server import PersistenceServer
+from sqlite_watched_status_server import SqliteWatchedStatusServer
+from watched_status_server import WatchedStatusServer
+
+
+def start_stub(server, delay=0):
+    """Runs a stub server on a daemon thread, answering every request after delay seconds"""
+    if delay:
+        handle = server.handle
+
+        def slow_handle(request):
+            time.sleep(delay)
+            return handle(request)
+
+        server.handle = slow_handle
+    threading.Thread(target=server.serve, daemon=True).start()
+    return server
+
+
+def start_stub_services(persistence_port=15555, watch_port=15557, delay=0, publish=False, watch_db=None):
+    """
+    Starts in-process persistence and watched status stubs on localhost.
+    With publish they announce changes on the port after their request port. With watch_db the watched
+    status stub keeps its data in that SQLite database (":memory:" for a throwaway one).
+    Returns (persistence server, watched status server, persistence endpoint, watched status endpoint).
+    """
+    persistence = start_stub(PersistenceServer(
+        f"tcp://127.0.0.1:{persistence_port}",
+        publish_endpoint=f"tcp://127.0.0.1:{persistence_port + 1}" if publish else None), delay)
+    watch_publish_endpoint = f"tcp://127.0.0.1:{watch_port + 1}" if publish else None
+    if watch_db is None:
+        watched_status = WatchedStatusServer(f"tcp://127.0.0.1:{watch_port}", watch_publish_endpoint)
+    else:
+        watched_status = SqliteWatchedStatusServer(f"tcp://127.0.0.1:{watch_port}", watch_db, watch_publish_endpoint)
+    start_stub(watched_status, delay)
+    return (persistence, watched_status,
+            f"tcp://127.0.0.1:{persistence_port}", f"tcp://127.0.0.1:{watch_port}")
@@ -0,0 +1,112 @@
+"""Regression tests for the non-interactive commands: each waits only for the services it uses, and bad
+option values are rejected up front.
+
+Run with: python -m pytest test_cli.py (or python -m unittest test_cli)
+"""
+import contextlib
+import io
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import cli
+from stub_services import start_stub_services
+
+
+class CommandTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with contextlib.redirect_stdout(io.StringIO()):
+            cls.persistence, _, cls.persistence_endpoint, cls.watch_endpoint = start_stub_services(
+                persistence_port=15965, watch_port=15967)
+        handle = cls.persistence.handle
+        cls.persistence_actions = []
+
+        def recording_handle(request):
+            cls.persistence_actions.append(request.get("action"))
+            return handle(request)
+
+        cls.persistence.handle = recording_handle
+
+    def setUp(self):
+        self.persistence.items = []
+        self.persistence_actions.clear()
+        journal_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, journal_root)
+        patcher = mock.patch("main.DEFAULT_JOURNAL_DIR", journal_root)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_command(self, *argv, endpoint=None):
+        """Runs a command against the stubs, returns (exit code, stdout, stderr)"""
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            exit_code = cli.main(["--persistence-endpoint", endpoint or self.persistence_endpoint,
+                                  "--watch-endpoint", self.watch_endpoint, *argv])
+        return exit_code, stdout.getvalue(), stderr.getvalue()
+
+    def test_mark_watched_does_not_load_the_watchlist(self):
+        exit_code, out, err = self.run_command("mark-watched", "Heat")
+        self.assertEqual(exit_code, 0, err)
+        self.assertEqual(self.persistence_actions, [])
+
+    def test_add_then_list(self):
+        self.assertEqual(self.run_command("add", "Heat", "Alien")[0], 0)
+        exit_code, out, err = self.run_command("list")
+        self.assertEqual(exit_code, 0, err)
+        self.assertEqual(out.splitlines(), ["Heat", "Alien"])
+
+    def test_list_fails_without_the_persistence_service(self):
+        # nothing listens on this port
+        exit_code, out, err = self.run_command("--timeout", "100", "--retries", "0", "list",
+                                               endpoint="tcp://127.0.0.1:15969")
+        self.assertEqual(exit_code, 1)
+        self.assertEqual(out, "")
+        self.assertIn("Persistence service unavailable", err)
+
+
+    def test_missing_input_file_is_reported(self):
+        for argv in (["add", "-f", "/nonexistent/titles.txt"],
+                     ["import", "--format", "jsonl", "/nonexistent/titles.jsonl"],
+                     ["mark-watched", "-f", "/nonexistent/watched.txt"]):
+            with self.subTest(command=argv[0]):
+                exit_code, out, err = self.run_command(*argv)
+                self.assertEqual(exit_code, 1)
+                self.assertIn("Error: /nonexistent/", err)
+                self.assertNotIn("Traceback", err)
+
+
+
+class ArgumentTest(unittest.TestCase):
+
+    def assertRejected(self, *argv):
+        with contextlib.redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+            cli.build_parser().parse_args(list(argv))
+
+    def test_timeout_must_be_positive(self):
+        self.assertRejected("--timeout", "0", "stats")
+        self.assertRejected("--timeout", "-5", "stats")
+        self.assertEqual(cli.build_parser().parse_args(["--timeout", "250", "stats"]).timeout, 250)
+
+    def test_retries_must_not_be_negative(self):
+        self.assertRejected("--retries", "-1", "stats")
+        self.assertEqual(cli.build_parser().parse_args(["--retries", "0", "stats"]).retries, 0)
+
+    def test_batch_size_must_be_positive(self):
+        for command in ("add", "import", "mark-watched", "export"):
+            with self.subTest(command=command):
+                self.assertRejected(command, "--batch-size", "0")
+                self.assertRejected(command, "--batch-size", "-3")
+        self.assertEqual(cli.build_parser().parse_args(["import", "--batch-size", "1"]).batch_size, 1)
+
+    def test_stats_interval_must_be_positive_and_finite(self):
+        for value in ("0", "-1", "nan", "inf"):
+            with self.subTest(value=value):
+                self.assertRejected("--stats-interval", value, "stats")
+        self.assertEqual(cli.build_parser().parse_args(["--stats-interval", "0.5", "stats"]).stats_interval, 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+"""Regression test: Watchlists saving to the same persistence service at once must not overwrite each other.
+
+Run with: python -m pytest test_concurrent_writers.py (or python -m unittest test_concurrent_writers)
+"""
+import contextlib
+import io
+import threading
+import time
+import unittest
+
+from main import Watchlist
+from stub_services import start_stub_services
+
+TITLES_PER_WRITER = 40
+
+
+class ConcurrentWritersTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with contextlib.redirect_stdout(io.StringIO()):
+            cls.persistence, _, cls.persistence_endpoint, cls.watch_endpoint = start_stub_services(
+                persistence_port=15945, watch_port=15947)
+
+    def setUp(self):
+        self.persistence.items = []
+
+    def watchlist(self):
+        watchlist = Watchlist(persistence_endpoint=self.persistence_endpoint, watch_endpoint=self.watch_endpoint)
+        self.addCleanup(watchlist.close)
+        return watchlist
+
+    def test_concurrent_adds_all_reach_the_service(self):
+        writers = [self.watchlist(), self.watchlist()]
+
+        def add_titles(number):
+            for i in range(TITLES_PER_WRITER):
+                self.assertTrue(writers[number].add(f"Writer {number} Movie {i}", quiet=True))
+
+        threads = [threading.Thread(target=add_titles, args=(number,)) for number in range(len(writers))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        expected = {f"Writer {number} Movie {i}" for number in range(len(writers)) for i in range(TITLES_PER_WRITER)}
+        self.assertEqual(set(self.persistence.items), expected)
+        self.assertEqual(len(self.persistence.items), len(expected))
+
+    def test_stale_writer_does_not_overwrite_newer_saves(self):
+        first, second = self.watchlist(), self.watchlist()
+        first.add("Heat", quiet=True)
+        # second still has the seq from before "Heat" was saved, so its delta is rejected once
+        second.add("Alien", quiet=True)
+        first.add("Jaws", quiet=True)
+
+        self.assertEqual(self.persistence.items, ["Heat", "Alien", "Jaws"])
+
+    def test_writer_requeues_after_endless_conflicts(self):
+        watchlist = self.watchlist()
+        handle = self.persistence.handle
+
+        def always_conflict(request):
+            if request.get("action") in ("add_items", "remove_items"):
+                return {"status": "conflict", "seq": self.persistence.seq}
+            return handle(request)
+
+        self.persistence.handle = always_conflict
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                # gives up after the rebases its retries allow instead of looping forever
+                self.assertTrue(watchlist.add("Heat", quiet=True))
+        finally:
+            self.persistence.handle = handle
+        self.assertEqual(self.persistence.items, [])
+
+        # the change stayed queued and goes out with the next flush
+        watchlist.flush()
+        deadline = time.monotonic() + 5
+        while self.persistence.items != ["Heat"] and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(self.persistence.items, ["Heat"])
+
+
+if __name__ == "__main__":
+    unittest.main()
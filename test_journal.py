@@ -0,0 +1,110 @@
+"""Regression tests: edits recorded after a crash tore the last journal line must survive the next load,
+only one process may write a journal at a time, and edits the CLI could not save reach the interactive session.
+
+Run with: python -m pytest test_journal.py (or python -m unittest test_journal)
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import cli
+from journal import Journal, JournalLocked, fcntl
+from main import Watchlist
+
+
+class JournalTornLineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_edits_after_a_torn_line_are_kept(self):
+        journal = Journal(self.directory)
+        journal.load()
+        journal.record("add", "Heat")
+        journal.record("add", "Alien")
+        journal.close()
+        with open(os.path.join(self.directory, "journal.log"), "a", encoding="utf-8") as f:
+            f.write('{"n": 3, "op": "add", "ti')
+
+        journal = Journal(self.directory)
+        titles, pending = journal.load()
+        self.assertEqual(titles, ["Heat", "Alien"])
+        journal.record("add", "Jaws")
+        journal.record("add", "Up")
+        journal.close()
+
+        titles, pending = Journal(self.directory, read_only=True).load()
+        self.assertEqual(titles, ["Heat", "Alien", "Jaws", "Up"])
+        self.assertEqual([title for op, title in pending], ["Heat", "Alien", "Jaws", "Up"])
+
+
+@unittest.skipIf(fcntl is None, "journals are not locked on this platform")
+class JournalLockTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_second_writer_is_refused_until_the_first_closes(self):
+        journal = Journal(self.directory)
+        journal.load()
+        journal.record("add", "Heat")
+        with self.assertRaises(JournalLocked):
+            Journal(self.directory)
+        # a reader still sees the edits
+        self.assertEqual(Journal(self.directory, read_only=True).load()[0], ["Heat"])
+
+        journal.close()
+        second = Journal(self.directory)
+        self.assertEqual(second.load()[0], ["Heat"])
+        second.close()
+
+
+
+class JournalAdoptTest(unittest.TestCase):
+    """Edits a CLI command journaled while the service was down reach the interactive session"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.ui_dir = os.path.join(self.directory, "ui")
+        self.cli_dir = os.path.join(self.directory, "cli")
+        journal = Journal(self.ui_dir)
+        journal.load()
+        journal.compact(["Heat", "Alien"], [])
+        journal.close()
+        journal = Journal(self.cli_dir)
+        journal.load()
+        journal.record("add", "Jaws")
+        journal.record("remove", "Heat")
+        journal.close()
+
+    def open_watchlist(self):
+        # nothing listens on the endpoints, so the session stays in memory mode
+        watchlist = Watchlist(journal_dir=self.ui_dir, adopt_journal_dirs=[self.cli_dir],
+                              persistence_endpoint="tcp://127.0.0.1:1", watch_endpoint="tcp://127.0.0.1:1",
+                              timeout=50, retries=0)
+        self.addCleanup(watchlist.close)
+        return watchlist
+
+    def test_session_takes_over_the_cli_edits(self):
+        watchlist = self.open_watchlist()
+        self.assertEqual(watchlist.titles(), ["Alien", "Jaws"])
+        watchlist.close()
+
+        # they are now the session's to send, and the CLI journal has none left
+        self.assertEqual(Journal(self.cli_dir, read_only=True).load()[1], [])
+        titles, pending = Journal(self.ui_dir, read_only=True).load()
+        self.assertEqual(titles, ["Alien", "Jaws"])
+        self.assertEqual(pending, [("add", "Jaws"), ("remove", "Heat")])
+
+    def test_list_local_merges_both_journals(self):
+        with mock.patch("cli.journal_dir_for", lambda endpoint, client="ui": os.path.join(self.directory, client)):
+            self.assertEqual(cli.local_titles("tcp://127.0.0.1:1"), ["Alien", "Jaws"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+"""Regression test: a full snapshot loaded page by page must not outlive the entries of its first pages.
+
+Run with: python -m pytest test_status_cache.py (or python -m unittest test_status_cache)
+"""
+import unittest
+from datetime import date
+from unittest import mock
+
+from status_cache import StatusCache
+
+
+class StatusCacheLoadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 100.0
+        patcher = mock.patch("status_cache.time.monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_paged_load_expires_with_its_first_page(self):
+        cache = StatusCache(ttl=10)
+        cache.begin_load()
+        cache.add_loaded([{"title": "Heat", "watched": True, "rating": 9}])
+        # the second page arrives most of a ttl later
+        self.now += 8
+        cache.add_loaded([{"title": "Alien", "watched": True}])
+        cache.finish_load()
+        self.assertEqual([movie["title"] for movie in cache.all_movies()], ["Heat", "Alien"])
+
+        # Heat's entry has expired, so the snapshot must not answer for it as unwatched
+        self.now += 3
+        self.assertIsNone(cache.get("Heat"))
+        self.assertIsNone(cache.all_movies())
+        self.assertTrue(cache.get("Alien")["watched"])
+
+    def test_single_page_load_answers_missing_titles_as_unwatched(self):
+        cache = StatusCache(ttl=10)
+        cache.load_all([{"title": "Heat", "watched": True}])
+        self.assertFalse(cache.get("Jaws")["watched"])
+        self.now += 10
+        self.assertIsNone(cache.get("Jaws"))
+
+
+class StatusCacheUpdateTest(unittest.TestCase):
+
+    def test_mark_watched_without_date_matches_the_service(self):
+        cache = StatusCache()
+        cache.load_all([{"title": "Heat", "watched": False, "watch_date": "2020-01-01"}])
+        cache.update("Heat", True)
+        cache.update("Jaws", True, 8)
+        # like the service, an existing date is kept and a movie without one gets today's
+        self.assertEqual(cache.get("Heat")["watch_date"], "2020-01-01")
+        self.assertEqual(cache.get("Jaws")["watch_date"], date.today().isoformat())
+
+    def test_unknown_title_is_not_cached(self):
+        cache = StatusCache()
+        cache.update("Heat", True)
+        self.assertIsNone(cache.get("Heat"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+"""Tests for the title search used by the remove and mark-watched flows: prefixes, typos and removal.
+
+Run with: python -m pytest test_title_index.py (or python -m unittest test_title_index)
+"""
+import unittest
+
+from title_index import TitleIndex
+
+TITLES = ["Heat", "Alien", "Aliens", "Jaws", "Rocky", "The Matrix", "Up", "Star Wars", "The Dark Knight",
+          "Love Story", "Night Of The Living Dead", "Heathers"]
+
+
+class TitleIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = TitleIndex()
+        self.index.add_many(TITLES)
+
+    def test_exact_title_comes_first(self):
+        self.assertEqual(self.index.search("alien")[0], "Alien")
+        self.assertEqual(self.index.search("HEAT", limit=1), ["Heat"])
+
+    def test_prefix_of_the_last_word(self):
+        self.assertEqual(self.index.search("star wa"), ["Star Wars"])
+        self.assertEqual(self.index.search("the dark kn"), ["The Dark Knight"])
+        # titles starting with the query rank above those only containing its words
+        self.assertEqual(self.index.search("the", limit=2), ["The Matrix", "The Dark Knight"])
+
+    def test_titles_with_every_word_come_before_fuzzy_matches(self):
+        self.assertEqual(self.index.search("night of the liv", limit=1), ["Night Of The Living Dead"])
+        self.assertEqual(self.index.search("the dark", limit=1), ["The Dark Knight"])
+
+    def test_one_typo_in_a_short_word(self):
+        for query, title in [("het", "Heat"), ("haet", "Heat"), ("alein", "Alien"), ("alen", "Alien"),
+                             ("jsws", "Jaws"), ("rocyk", "Rocky"), ("matirx", "The Matrix")]:
+            with self.subTest(query=query):
+                self.assertEqual(self.index.search(query)[0], title)
+
+    def test_typo_in_a_longer_title(self):
+        self.assertEqual(self.index.search("dark knigth")[0], "The Dark Knight")
+        self.assertEqual(self.index.search("nigth of the living ded")[0], "Night Of The Living Dead")
+
+    def test_unrelated_query_matches_nothing(self):
+        self.assertEqual(self.index.search("xyz"), [])
+        self.assertEqual(self.index.search(""), [])
+
+    def test_removed_title_is_not_found(self):
+        self.index.remove("Heat")
+        self.assertNotIn("Heat", self.index.search("heat"))
+        self.assertNotIn("Heat", self.index.search("het"))
+        self.assertEqual(self.index.search("heath"), ["Heathers"])
+        self.assertEqual(len(self.index), len(TITLES) - 1)
+
+    def test_removing_the_last_title_with_a_word_drops_the_word(self):
+        self.index.remove("Jaws")
+        self.assertEqual(self.index.search("jaws"), [])
+        self.assertEqual(self.index.search("ja"), [])
+        self.index.add("Jaws")
+        self.assertEqual(self.index.search("jsws"), ["Jaws"])
+
+
+if __name__ == "__main__":
+    unittest.main()
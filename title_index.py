@@ -0,0 +1,252 @@
+import heapq
+import math
+import re
+import string
+from bisect import bisect_left, insort
+from collections import defaultdict
+from itertools import islice
+
+from titles import title_key
+
+WORD = re.compile(r"\w+")
+
+
+def _words(key):
+    return WORD.findall(key)
+
+
+def _one_edit_variants(word):
+    """Returns the strings one deletion, transposition, substitution or insertion away from word"""
+    letters = set(string.ascii_lowercase + string.digits + word)
+    splits = [(word[:i], word[i:]) for i in range(len(word) + 1)]
+    variants = {left + right[1:] for left, right in splits if right}
+    variants.update(left + right[1] + right[0] + right[2:] for left, right in splits if len(right) > 1)
+    variants.update(left + letter + right[1:] for left, right in splits if right for letter in letters)
+    variants.update(left + letter + right for left, right in splits for letter in letters)
+    variants.discard(word)
+    return variants
+
+
+def _grams(word):
+    """Returns the set of trigrams of a word, padded so short words and word edges still count"""
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TitleIndex:
+    """Prefix and typo-tolerant search over watchlist titles.
+
+    Titles are split into words. Each word maps to the keys of the titles
+    containing it, and the distinct words are kept in a sorted list so the
+    words starting with a prefix are found with a binary search. For typos,
+    every word is also indexed by its trigrams, so a misspelt query word is
+    matched to the vocabulary words sharing most of its trigrams, and a short
+    one to the vocabulary words one edit away. Prefix lookups take well under
+    a millisecond for 100k titles. Typo matching only compares the vocabulary
+    words sharing a rare trigram with the query, but on a large vocabulary of
+    similar words (numbered titles, say) that can take a few milliseconds.
+    """
+
+    def __init__(self, key=None, max_candidates=500, edit_check_length=7):
+        self._key = key or title_key
+        # prefix matches are ranked among at most this many titles
+        self.max_candidates = max_candidates
+        # words up to this long are also matched to the vocabulary words one typo away
+        self.edit_check_length = edit_check_length
+        self._titles = {}
+        self._postings = defaultdict(set)
+        self._vocabulary = []
+        self._word_grams = defaultdict(set)
+        # the trigrams of each vocabulary word, so typo matching doesn't recompute them per query
+        self._grams_by_word = {}
+
+    def __len__(self):
+        return len(self._titles)
+
+    def add(self, title):
+        key = self._key(title)
+        if key in self._titles:
+            self._titles[key] = title
+            return
+        self._titles[key] = title
+        for word in set(_words(key)):
+            postings = self._postings[word]
+            if not postings:
+                insort(self._vocabulary, word)
+                self._index_grams(word)
+            postings.add(key)
+
+    def _index_grams(self, word):
+        grams = self._grams_by_word[word] = _grams(word)
+        for gram in grams:
+            self._word_grams[gram].add(word)
+
+    def add_many(self, titles):
+        """Adds many titles, sorting the vocabulary once instead of per new word"""
+        new_words = []
+        for title in titles:
+            key = self._key(title)
+            if key in self._titles:
+                continue
+            self._titles[key] = title
+            for word in set(_words(key)):
+                postings = self._postings[word]
+                if not postings:
+                    new_words.append(word)
+                    self._index_grams(word)
+                postings.add(key)
+        if new_words:
+            self._vocabulary.extend(new_words)
+            self._vocabulary.sort()
+
+    def remove(self, title):
+        key = self._key(title)
+        if self._titles.pop(key, None) is None:
+            return
+        for word in set(_words(key)):
+            postings = self._postings.get(word)
+            if postings is None:
+                continue
+            postings.discard(key)
+            if not postings:
+                del self._postings[word]
+                del self._vocabulary[bisect_left(self._vocabulary, word)]
+                for gram in self._grams_by_word.pop(word):
+                    words = self._word_grams[gram]
+                    words.discard(word)
+                    if not words:
+                        del self._word_grams[gram]
+
+    def clear(self):
+        self._titles.clear()
+        self._postings.clear()
+        self._vocabulary.clear()
+        self._word_grams.clear()
+        self._grams_by_word.clear()
+
+    def search(self, query, limit=10):
+        """Returns up to limit titles matching query, best first.
+
+        An exact title comes first, then titles whose words start with the
+        query's words (titles starting with the whole query ranked higher, then
+        shorter titles). Unless the query is an exact title, fuzzy matches fill
+        the remaining places.
+        """
+        query_key = self._key(query)
+        words = _words(query_key)
+        if not words or limit <= 0:
+            return []
+
+        ranked = self._prefix_matches(query_key, words, limit)
+        results = [self._titles[key] for key in ranked]
+        if len(results) < limit and query_key not in self._titles:
+            seen = set(ranked)
+            for key in self._fuzzy_matches(words, limit + len(seen)):
+                if key not in seen:
+                    results.append(self._titles[key])
+                    if len(results) == limit:
+                        break
+        return results
+
+    def _prefix_matches(self, query_key, words, limit):
+        """The best limit keys of titles containing every complete query word and a word starting with the last one"""
+        *complete, last = words
+        required = []
+        for word in complete:
+            postings = self._postings.get(word)
+            if not postings:
+                return []
+            required.append(postings)
+        candidates = set()
+        position = bisect_left(self._vocabulary, last)
+        while position < len(self._vocabulary) and len(candidates) < self.max_candidates:
+            word = self._vocabulary[position]
+            if not word.startswith(last):
+                break
+            needed = self.max_candidates - len(candidates)
+            postings = self._postings[word]
+            if required:
+                postings = self._intersect([postings] + required, needed)
+            candidates.update(islice(postings, needed))
+            position += 1
+        if query_key in self._titles:
+            candidates.add(query_key)
+        return heapq.nsmallest(limit, candidates,
+                               key=lambda key: (key != query_key, not key.startswith(query_key), len(key), key))
+
+    @staticmethod
+    def _intersect(sets, needed, chunk_size=1024):
+        """
+        Returns at least needed keys found in every set (fewer if there aren't as many). The smallest set is
+        intersected with the others a chunk at a time, so the set operations run in C but stop early when
+        common words match plenty of titles.
+        """
+        smallest, *others = sorted(sets, key=len)
+        keys = iter(smallest)
+        found = []
+        while len(found) < needed:
+            chunk = set(islice(keys, chunk_size))
+            if not chunk:
+                break
+            found.extend(chunk.intersection(*others))
+        return found
+
+    def _similar_words(self, word, limit=20, threshold=0.3):
+        """
+        Returns up to limit (vocabulary word, similarity) pairs sharing enough trigrams with word, or, for
+        words short enough that one typo leaves too few trigrams in common, one edit away from it.
+        """
+        if len(word) < 3:
+            # too short to tell a typo from a different word
+            return [(word, 1.0)] if word in self._postings else []
+        similar = {}
+        if len(word) <= self.edit_check_length:
+            # a typo in a short word changes most of its trigrams ("het" and "heat" share 2 of 7), so its
+            # one-edit variants are looked up instead, scored like a trigram match of a longer word
+            for variant in _one_edit_variants(word):
+                if variant in self._postings:
+                    similar[variant] = 1 - 1 / len(word)
+        query_grams = _grams(word)
+        # a word reaching the threshold shares at least min_shared trigrams with the query, so it has
+        # one of the len - min_shared + 1 rarest and only the words of those need comparing
+        min_shared = math.ceil(threshold * (len(query_grams) + 1) / (1 + threshold))
+        rarest = sorted(query_grams, key=lambda gram: len(self._word_grams.get(gram, ())))
+        candidates = set().union(*(self._word_grams.get(gram, ()) for gram in rarest[:len(rarest) - min_shared + 1]))
+        for candidate in candidates:
+            candidate_grams = self._grams_by_word[candidate]
+            shared = len(query_grams & candidate_grams)
+            # Jaccard similarity of the two trigram sets
+            similarity = shared / (len(query_grams) + len(candidate_grams) - shared)
+            if similarity >= threshold and similarity > similar.get(candidate, 0):
+                similar[candidate] = similarity
+        return [(candidate, similarity) for similarity, candidate in
+                heapq.nlargest(limit, ((similarity, candidate) for candidate, similarity in similar.items()))]
+
+    def _fuzzy_matches(self, words, limit):
+        """Keys of titles whose words are most similar to the query words"""
+        expansions = []
+        for word in words:
+            similar = self._similar_words(word)
+            expansions.append((sum(len(self._postings[candidate]) for candidate, _ in similar), similar))
+        expansions.sort(key=lambda expansion: expansion[0])
+        # common words only pick titles themselves when the query has nothing rarer
+        all_common = expansions[0][0] > self.max_candidates
+        scores = defaultdict(float)
+        for size, similar in expansions:
+            if size > self.max_candidates and (scores or not all_common):
+                # a common word only adds to the titles the rarer words already matched
+                for key in scores:
+                    scores[key] += max((similarity for candidate, similarity in similar
+                                        if key in self._postings[candidate]), default=0)
+                continue
+            best = {}
+            for candidate, similarity in similar:
+                for key in islice(self._postings[candidate], self.max_candidates):
+                    if similarity > best.get(key, 0):
+                        best[key] = similarity
+            for key, similarity in best.items():
+                scores[key] += similarity
+        # the query words have to be matched with an average similarity of at least 0.4
+        minimum = len(words) * 0.4
+        matches = [(score, -len(key), key) for key, score in scores.items() if score >= minimum]
+        return [key for score, length, key in heapq.nlargest(limit, matches)]
@@ -0,0 +1,7 @@
+def title_key(title):
+    """Returns the key movie titles are matched by, in the clients and the services alike.
+
+    Titles differing only in case or surrounding spaces are the same movie. casefold() rather than
+    lower() so that e.g. "Straße" and "STRASSE" are one key everywhere.
+    """
+    return title.strip().casefold()
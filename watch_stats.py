@@ -0,0 +1,164 @@
+import threading
+from bisect import bisect_left, insort
+from datetime import date
+from itertools import islice
+
+from titles import title_key
+
+
+class WatchStats:
+    """Watch counts, average rating and rankings over the movies the watched status service knows.
+
+    Kept up to date as statuses are loaded or changed instead of being
+    recomputed per query. Watched movies with a rating are kept in a list
+    sorted by rating and those with a watch date in a list sorted by date,
+    so a top-N query reads k entries off one end and a date range costs a
+    binary search plus the k entries in it.
+    """
+
+    def __init__(self, key=None):
+        self._key = key or title_key
+        self._movies = {}
+        # (-rating, key) of watched, rated movies, highest rating first
+        self._by_rating = []
+        # (watch_date, key) of watched movies with a date string, oldest first
+        self._by_date = []
+        self.watched = 0
+        self.rated = 0
+        self._rating_total = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _rating(movie):
+        rating = movie["rating"]
+        return rating if isinstance(rating, (int, float)) and not isinstance(rating, bool) else None
+
+    @staticmethod
+    def _watch_date(movie):
+        # only strings are ordered against each other, another type stored on the service is left out
+        watch_date = movie["watch_date"]
+        return watch_date if isinstance(watch_date, str) and watch_date else None
+
+    def _unindex(self, key, movie):
+        if not movie["watched"]:
+            return
+        self.watched -= 1
+        rating = self._rating(movie)
+        if rating is not None:
+            self.rated -= 1
+            self._rating_total -= rating
+            del self._by_rating[bisect_left(self._by_rating, (-rating, key))]
+        watch_date = self._watch_date(movie)
+        if watch_date is not None:
+            del self._by_date[bisect_left(self._by_date, (watch_date, key))]
+
+    def _index(self, key, movie, sort=True):
+        if not movie["watched"]:
+            return
+        self.watched += 1
+        rating = self._rating(movie)
+        if rating is not None:
+            self.rated += 1
+            self._rating_total += rating
+            if sort:
+                insort(self._by_rating, (-rating, key))
+            else:
+                self._by_rating.append((-rating, key))
+        watch_date = self._watch_date(movie)
+        if watch_date is not None:
+            if sort:
+                insort(self._by_date, (watch_date, key))
+            else:
+                self._by_date.append((watch_date, key))
+
+    def _set(self, movie, sort=True):
+        title = movie.get("title")
+        if not title or not isinstance(title, str):
+            return
+        key = self._key(title)
+        old = self._movies.get(key)
+        if old is not None:
+            self._unindex(key, old)
+        new = {"title": title, "watched": bool(movie.get("watched", False)), "rating": movie.get("rating"),
+               "watch_date": movie.get("watch_date")}
+        self._movies[key] = new
+        self._index(key, new, sort)
+
+    def set_status(self, movie):
+        """Replaces the status of movie["title"] with the one given, as reported by the service"""
+        with self._lock:
+            self._set(movie)
+
+    def update(self, title, watched, rating=None, watch_date=None):
+        """Applies a mark_watched/mark_unwatched the way the service does: fields that are None are kept"""
+        with self._lock:
+            current = self._movies.get(self._key(title)) or {"rating": None, "watch_date": None}
+            movie = {"title": title, "watched": watched,
+                     "rating": rating if rating is not None else current["rating"],
+                     "watch_date": watch_date if watch_date is not None else current["watch_date"]}
+            if watched and movie["watch_date"] is None:
+                movie["watch_date"] = date.today().isoformat()
+            self._set(movie)
+
+    def begin_load(self):
+        """Starts replacing everything with the service's full movie list, delivered by add_loaded()"""
+        with self._lock:
+            self._movies.clear()
+            self._by_rating.clear()
+            self._by_date.clear()
+            self.watched = self.rated = 0
+            self._rating_total = 0
+
+    def add_loaded(self, movies):
+        """Adds one page of the full movie list, sorting the indexes once for the whole page"""
+        with self._lock:
+            # a title repeated in the page (or seen on an earlier one) keeps its latest status. The old entries
+            # are dropped while the indexes are still sorted, since removing one takes a binary search.
+            page = {}
+            for movie in movies:
+                if movie.get("title") and isinstance(movie["title"], str):
+                    page[self._key(movie["title"])] = movie
+            for key in page:
+                old = self._movies.pop(key, None)
+                if old is not None:
+                    self._unindex(key, old)
+            for movie in page.values():
+                self._set(movie, sort=False)
+            self._by_rating.sort()
+            self._by_date.sort()
+
+    def load_all(self, movies):
+        """Replaces everything with the service's full movie list"""
+        self.begin_load()
+        self.add_loaded(movies)
+
+    def _status(self, key):
+        return dict(self._movies[key])
+
+    def top_rated(self, n=20):
+        """Returns the n highest rated watched movies, best first"""
+        with self._lock:
+            return [self._status(key) for rating, key in islice(self._by_rating, n)]
+
+    def recently_watched(self, n=20):
+        """Returns the n most recently watched movies, latest first"""
+        with self._lock:
+            return [self._status(key) for watch_date, key in islice(reversed(self._by_date), n)]
+
+    def watched_between(self, start, end):
+        """Returns the movies watched from start up to but not including end (ISO dates), latest first"""
+        with self._lock:
+            low = bisect_left(self._by_date, (start,))
+            high = bisect_left(self._by_date, (end,))
+            return [self._status(key) for watch_date, key in reversed(self._by_date[low:high])]
+
+    def summary(self):
+        """Returns the movie, watched and rated counts and the average rating of the watched movies"""
+        with self._lock:
+            return {
+                "movies": len(self._movies),
+                "watched": self.watched,
+                "unwatched": len(self._movies) - self.watched,
+                "rated": self.rated,
+                "average_rating": round(self._rating_total / self.rated, 2) if self.rated else None
+            }
@@ -1,29 +1,52 @@
-import zmq
+import threading
+
+import reliable_request
+import wire_format
+# the clients signal a service that can't page the same way
+from persistence_client import PagingUnsupported
+from status_cache import StatusCache
+from watch_stats import WatchStats
+
+# actions that only read, so any replica can answer them. Handles live on the replica that registered them,
+# so register_list/filter_by_handle go to the primary with the writes.
+READ_ACTIONS = ("get_status", "get_status_many", "get_all_movies", "get_all_movies_page",
+                "get_unwatched_from_list", "get_watched_from_list", "filter_by_status")
 
 
 class WatchedStatusClient:
-    def __init__(self, endpoint="tcp://localhost:5557"):
+    def __init__(self, endpoint="tcp://localhost:5557", timeout=1500, retries=2, cache_ttl=60.0,
+                 cache_size=10000, pool_size=1, hedge=False):
         self.endpoint = endpoint
-        self._context = zmq.Context.instance()
-        self._socket = self._context.socket(zmq.REQ)
-        self._socket.connect(self.endpoint)
+        self.cache = StatusCache(cache_ttl, cache_size)
+        # counts and rankings, kept up to date with every status this client loads or changes
+        self.watch_stats = WatchStats()
+        # set to False once the service turns out not to know register_list/filter_by_handle
+        self.supports_handles = True
+        # (content hash, handle) of the list last registered with the service
+        self._registered_list = None
+        # seq of the last change event applied, to notice missed ones
+        self._event_seq = None
+        # True while the movies are being read again after missed change events
+        self._reloading = False
+        self._reload_lock = threading.Lock()
+        # endpoint may be a list of replicas: reads are then spread over them and writes fail over, and
+        # hedge duplicates reads that are slower than usual to a second replica. pool_size sockets per
+        # replica let that many threads wait on the service at once.
+        self._transport = reliable_request.connect(endpoint, "watched status service", pool_size=pool_size,
+                                                   read_actions=READ_ACTIONS, hedge=hedge, timeout=timeout,
+                                                   retries=retries)
 
     def _send_request(self, data):
         """Send a request to the watched status tracker service and wait for response."""
-        try:
-            self._socket.send_json(data)
+        return self._transport.request(data)
 
-            # wait 2 seconds for response
-            if self._socket.poll(1500):
-                response = self._socket.recv_json()
-                return response
-            else:
-                return None
-        except KeyboardInterrupt:
-            raise
-        except Exception as e:
-            print(f"Error sending request to persistence service: {e}")
-            return None
+    def is_healthy(self):
+        """Returns False if the latest request to the service went unanswered"""
+        return self._transport.is_healthy()
+
+    def stats(self):
+        """Returns per-action latency, timeout, error and byte counters for requests to the service"""
+        return self._transport.stats.snapshot()
 
     def mark_watched(self, title, rating=None, watch_date=None):
         """Mark a movie as watched."""
@@ -40,7 +63,10 @@ class WatchedStatusClient:
             request_data["watch_date"] = watch_date
 
         response = self._send_request(request_data)
-        return response and response.get("status") == "success"
+        success = response and response.get("status") == "success"
+        if success:
+            self._update_cache(title, True, rating, watch_date)
+        return success
 
     def mark_unwatched(self, title, rating=None, watch_date=None):
         """Mark a movie as unwatched."""
@@ -57,10 +83,103 @@ class WatchedStatusClient:
             request_data["watch_date"] = watch_date
 
         response = self._send_request(request_data)
-        return response and response.get("status") == "success"
+        success = response and response.get("status") == "success"
+        if success:
+            self._update_cache(title, False, rating, watch_date)
+        return success
+
+    def mark_watched_many(self, entries):
+        """Mark many movies as watched in a single request.
+
+        entries is a list of (title, rating, watch_date) tuples, rating and watch_date may be None.
+        Falls back to one request per movie if the service doesn't support batches.
+        """
+        movies = []
+        for title, rating, watch_date in entries:
+            movie = {"title": title}
+            if rating is not None:
+                movie["rating"] = rating
+            if watch_date is not None:
+                movie["watch_date"] = watch_date
+            movies.append(movie)
+        if not movies:
+            return True
+
+        response = self._send_request({
+            "action": "mark_watched_many",
+            "version": 1,
+            "movies": movies
+        })
+        if self._is_unknown_action(response):
+            return all([self.mark_watched(title, rating, watch_date) for title, rating, watch_date in entries])
+
+        success = response is not None and response.get("status") == "success"
+        if success:
+            for title, rating, watch_date in entries:
+                self._update_cache(title, True, rating, watch_date)
+        return success
+
+    def get_status_many(self, titles):
+        """Get the watch status of many movies in a single request.
+
+        Returns a dict of title -> status (as returned by get_status), or None if the request failed.
+        Titles already in the cache are not sent.
+        """
+        statuses = {}
+        missing = []
+        for title in titles:
+            cached = self.cache.get(title)
+            if cached is None:
+                missing.append(title)
+            else:
+                statuses[title] = {"watched": cached["watched"], "rating": cached["rating"],
+                                   "watch_date": cached["watch_date"]}
+        if not missing:
+            return statuses
+
+        response = self._send_request({
+            "action": "get_status_many",
+            "version": 1,
+            "titles": missing
+        })
+        if self._is_unknown_action(response):
+            for title in missing:
+                status = self.get_status(title)
+                if status is None:
+                    return None
+                statuses[title] = status
+            return statuses
+
+        if response and response.get("status") == "success":
+            for title, movie in zip(missing, response.get("statuses", [])):
+                status = {
+                    "watched": movie.get("watched", False),
+                    "rating": movie.get("rating"),
+                    "watch_date": movie.get("watch_date")
+                }
+                self.cache.put(title, **status)
+                self.watch_stats.set_status({"title": title, **status})
+                statuses[title] = status
+            return statuses
+        return None
+
+    @staticmethod
+    def _is_unknown_action(response):
+        """True if the service answered but doesn't implement the requested action"""
+        return bool(response) and response.get("status") == "error" and \
+            str(response.get("message", "")).startswith("Unknown action")
+
+    def _update_cache(self, title, watched, rating, watch_date):
+        """Write-through of a status change made by this client"""
+        self.cache.update(title, watched, rating, watch_date)
+        self.watch_stats.update(title, watched, rating, watch_date)
 
     def get_status(self, title):
         """Get the watch status of a movie."""
+        cached = self.cache.get(title)
+        if cached is not None:
+            return {"watched": cached["watched"], "rating": cached["rating"], "watch_date": cached["watch_date"]}
+
         response = self._send_request({
             "action": "get_status",
             "version": 1,
@@ -68,11 +187,14 @@ class WatchedStatusClient:
         })
 
         if response and response.get("status") == "success":
-            return {
+            status = {
                 "watched": response.get("watched", False),
                 "rating": response.get("rating"),
                 "watch_date": response.get("watch_date")
             }
+            self.cache.put(title, **status)
+            self.watch_stats.set_status({"title": title, **status})
+            return status
         return None
 
     def get_all_movies(self):
@@ -83,65 +205,219 @@ class WatchedStatusClient:
         })
 
         if response and response.get("status") == "success":
-            return response.get("movies", [])
+            movies = response.get("movies", [])
+            self.cache.load_all(movies)
+            self.watch_stats.load_all(movies)
+            return movies
+        return None
+
+    def get_movies_page(self, cursor=None, limit=1000):
+        """
+        Get one page of movies and their watch status. Returns (movies, next_cursor), next_cursor is None on
+        the last page. Returns None if the request failed and raises PagingUnsupported if the service
+        can't page.
+        """
+        response = self._send_request({
+            "action": "get_all_movies_page",
+            "version": 1,
+            "cursor": cursor,
+            "limit": limit
+        })
+        if self._is_unknown_action(response):
+            raise PagingUnsupported("watched status service does not support paging")
+        if response and response.get("status") == "success":
+            return response.get("movies", []), response.get("next_cursor")
         return None
 
+    def iter_all_movies(self, limit=1000):
+        """
+        Yields all movies one page at a time, warming the status cache as they arrive.
+        Raises ConnectionError if the service stops answering part way through.
+        """
+        cursor = None
+        self.cache.begin_load()
+        self.watch_stats.begin_load()
+        while True:
+            try:
+                page = self.get_movies_page(cursor, limit)
+            except PagingUnsupported:
+                movies = self.get_all_movies()
+                if movies is None:
+                    raise ConnectionError("watched status service not responding")
+                yield movies
+                return
+            if page is None:
+                raise ConnectionError("watched status service not responding")
+            movies, cursor = page
+            self.cache.add_loaded(movies)
+            self.watch_stats.add_loaded(movies)
+            yield movies
+            if cursor is None:
+                self.cache.finish_load()
+                return
+
+    def _cached_or_all_movies(self):
+        """All movies from the cache when its snapshot is fresh, otherwise from the service"""
+        movies = self.cache.all_movies()
+        if movies is None:
+            movies = self.get_all_movies()
+        return movies
+
     def get_unwatched_movies(self):
         """Get a list of the unwatched movies only"""
-        all_movies = self.get_all_movies()
+        all_movies = self._cached_or_all_movies()
         if all_movies is None:
             return []
         return [movie for movie in all_movies if not movie.get("watched", False)]
 
     def get_watched_movies(self):
         """Get a list of the watched movies only"""
-        all_movies = self.get_all_movies()
+        all_movies = self._cached_or_all_movies()
         if all_movies is None:
             return []
         return [movie for movie in all_movies if movie.get("watched", False)]
 
     def get_unwatched_from_list(self, movie_list):
         """Filter a specific list to show the unwatched movies only."""
-        response = self._send_request({
+        cached = self.cache.get_many(movie_list)
+        if cached is not None:
+            return [title for title, status in zip(movie_list, cached) if not status["watched"]]
+
+        filtered = self._filter_on_service(movie_list, False, {
             "action": "get_unwatched_from_list",
             "version": 1,
             "movie_list": movie_list
-        })
+        }, "unwatched_movies")
 
-        if response and response.get("status") == "success":
-            return response.get("unwatched_movies", [])
+        if filtered is not None:
+            return filtered
         print("Note: Watch status service unavailable. Showing all movies.")
         return movie_list
 
     def get_watched_from_list(self, movie_list):
         """Filter a specific list to show the watched movies only."""
-        response = self._send_request({
+        cached = self.cache.get_many(movie_list)
+        if cached is not None:
+            return [title for title, status in zip(movie_list, cached) if status["watched"]]
+
+        filtered = self._filter_on_service(movie_list, True, {
             "action": "get_watched_from_list",
             "version": 1,
             "movie_list": movie_list
-        })
+        }, "watched_movies")
 
-        if response and response.get("status") == "success":
-            return response.get("watched_movies", [])
+        if filtered is not None:
+            return filtered
         print("Note: Watch status service unavailable. Cannot verify watched movies.")
         return []
 
     def filter_by_status(self, movie_list, watched=True):
         """Filter a movie list by watch status"""
-        response = self._send_request({
+        cached = self.cache.get_many(movie_list)
+        if cached is not None:
+            return [title for title, status in zip(movie_list, cached) if status["watched"] == watched]
+
+        filtered = self._filter_on_service(movie_list, watched, {
             "action": "filter_by_status",
             "version": 1,
             "movie_list": movie_list,
             "watched": watched
-        })
+        }, "filtered_movies")
 
-        if response and response.get("status") == "success":
-            return response.get("filtered_movies", [])
+        if filtered is not None:
+            return filtered
         return movie_list if not watched else []
 
+    def _filter_on_service(self, movie_list, watched, list_request, result_key):
+        """
+        Filters movie_list by watch status on the service and returns the matching titles, or None if the
+        service didn't answer. The list is registered once and later filtered by its handle, so it is only
+        uploaded again when its content changes. Services without handle support get list_request instead.
+        """
+        if self.supports_handles:
+            for attempt in range(2):
+                handle = self._list_handle(movie_list)
+                if handle is None:
+                    break
+                response = self._send_request({
+                    "action": "filter_by_handle",
+                    "version": 1,
+                    "handle": handle,
+                    "watched": watched
+                })
+                if response and response.get("status") == "success":
+                    return response.get("filtered_movies", [])
+                if not (response and response.get("message") == "Unknown handle"):
+                    return None
+                # the service forgot the list (e.g. it restarted), register it again
+                self._registered_list = None
+            if self.supports_handles:
+                return None
+
+        response = self._send_request(list_request)
+        if response and response.get("status") == "success":
+            return response.get(result_key, [])
+        return None
+
+    def _list_handle(self, movie_list):
+        """Returns the service's handle for movie_list, registering the list if its content changed"""
+        digest = wire_format.content_hash(movie_list)
+        if self._registered_list is not None and self._registered_list[0] == digest:
+            return self._registered_list[1]
+
+        response = self._send_request({
+            "action": "register_list",
+            "version": 1,
+            "movie_list": movie_list
+        })
+        if self._is_unknown_action(response):
+            self.supports_handles = False
+            return None
+        if response and response.get("status") == "success":
+            self._registered_list = (response.get("hash", digest), response.get("handle"))
+            return self._registered_list[1]
+        return None
+
+    def apply_change(self, event):
+        """Updates the cache from a status change event published by the service"""
+        seq = event.get("seq")
+        if self._event_seq is not None and seq is not None and seq != self._event_seq + 1:
+            # missed some changes, so any cached status and the watch statistics may be out of date
+            self.cache.invalidate()
+            self._reload()
+        self._event_seq = seq
+        for movie in event.get("movies", []):
+            if movie.get("title"):
+                self.cache.put(movie["title"], watched=movie.get("watched", False), rating=movie.get("rating"),
+                               watch_date=movie.get("watch_date"))
+                self.watch_stats.set_status(movie)
+
+    def _reload(self):
+        """Reads every movie again in the background, rebuilding the status cache and watch statistics"""
+        with self._reload_lock:
+            if self._reloading:
+                return
+            self._reloading = True
+
+        def reload():
+            try:
+                for page in self.iter_all_movies():
+                    pass
+            except Exception:
+                # the invalidated cache reads statuses from the service until the next reload
+                pass
+            finally:
+                self._reloading = False
+
+        threading.Thread(target=reload, daemon=True).start()
+
+    def cache_stats(self):
+        """Returns the status cache hit/miss counters"""
+        return self.cache.stats()
+
     def close(self):
-        if hasattr(self, '_socket'):
-            self._socket.close()
+        if hasattr(self, '_transport'):
+            self._transport.close()
 
     def __del__(self):
         self.close()
\ No newline at end of file
@@ -0,0 +1,149 @@
+import argparse
+from collections import OrderedDict
+from datetime import date
+from itertools import islice
+
+import wire_format
+from change_feed import STATUS_TOPIC
+from request_server import RequestServer
+from titles import title_key
+
+
+class WatchedStatusServer(RequestServer):
+    """Local stand-in for the watched status microservice, for offline testing.
+
+    Keeps the watch status, rating and watch date of each movie in memory,
+    keyed by title_key(), as the clients key them. With a publish_endpoint every status
+    change is published as a "status" event carrying the new statuses and a
+    sequence number, so subscribers can tell when they missed one.
+    """
+
+    name = "Watched status"
+    topic = STATUS_TOPIC
+
+    # how many registered lists to remember before dropping the oldest
+    MAX_LISTS = 64
+
+    def __init__(self, endpoint="tcp://*:5557", publish_endpoint=None):
+        super().__init__(endpoint, publish_endpoint)
+        self.movies = {}
+        self.lists = OrderedDict()
+        self.event_seq = 0
+
+    def _is_watched(self, title):
+        movie = self.movies.get(title_key(title))
+        return movie is not None and movie["watched"]
+
+    def _status(self, title):
+        """Returns the status of a title, unwatched if the service has never seen it"""
+        movie = self.movies.get(title_key(title))
+        if movie is None:
+            return {"title": title, "watched": False, "rating": None, "watch_date": None}
+        return dict(movie)
+
+    def _set_status(self, fields, watched):
+        """Marks fields["title"] watched/unwatched, applying the optional rating and watch_date. Returns the new status."""
+        title = fields["title"]
+        movie = self.movies.setdefault(title_key(title), {"title": title, "rating": None, "watch_date": None})
+        movie["watched"] = watched
+        if fields.get("rating") is not None:
+            movie["rating"] = fields["rating"]
+        if watched:
+            movie["watch_date"] = fields.get("watch_date") or movie["watch_date"] or date.today().isoformat()
+        elif fields.get("watch_date") is not None:
+            movie["watch_date"] = fields["watch_date"]
+        return dict(movie)
+
+    def _changed(self, movies):
+        """Queues the event for status changes made by a request"""
+        self.event_seq += 1
+        self._outbox.append({"event": "changed", "seq": self.event_seq, "movies": movies})
+
+    def handle(self, request):
+        """Returns the response for a single request"""
+        action = request.get("action")
+
+        if action == "negotiate":
+            return {"status": "success", "version": wire_format.choose_version(request.get("versions", []))}
+
+        if action in ("mark_watched", "mark_unwatched"):
+            if not request.get("title"):
+                return {"status": "error", "message": "title is required"}
+            self._changed([self._set_status(request, action == "mark_watched")])
+            return {"status": "success"}
+
+        if action == "mark_watched_many":
+            movies = request.get("movies")
+            if not isinstance(movies, list) or not all(movie.get("title") for movie in movies):
+                return {"status": "error", "message": "movies must be a list of objects with a title"}
+            self._changed([self._set_status(movie, True) for movie in movies])
+            return {"status": "success", "count": len(movies)}
+
+        if action == "get_status":
+            status = self._status(request.get("title", ""))
+            del status["title"]
+            return {"status": "success", **status}
+
+        if action == "get_status_many":
+            return {"status": "success",
+                    "statuses": [self._status(title) for title in request.get("titles", [])]}
+
+        if action == "get_all_movies":
+            return {"status": "success", "movies": [dict(movie) for movie in self.movies.values()]}
+
+        if action == "get_all_movies_page":
+            offset = int(request.get("cursor") or 0)
+            limit = max(1, int(request.get("limit") or 1000))
+            movies = [dict(movie) for movie in islice(self.movies.values(), offset, offset + limit)]
+            next_cursor = str(offset + limit) if offset + limit < len(self.movies) else None
+            return {"status": "success", "movies": movies, "next_cursor": next_cursor}
+
+        if action == "get_unwatched_from_list":
+            movie_list = request.get("movie_list", [])
+            return {"status": "success",
+                    "unwatched_movies": [title for title in movie_list if not self._is_watched(title)]}
+
+        if action == "get_watched_from_list":
+            movie_list = request.get("movie_list", [])
+            return {"status": "success",
+                    "watched_movies": [title for title in movie_list if self._is_watched(title)]}
+
+        if action == "register_list":
+            movie_list = request.get("movie_list")
+            if not isinstance(movie_list, list):
+                return {"status": "error", "message": "movie_list must be a list"}
+            handle = wire_format.content_hash(movie_list)
+            self.lists[handle] = movie_list
+            self.lists.move_to_end(handle)
+            while len(self.lists) > self.MAX_LISTS:
+                self.lists.popitem(last=False)
+            return {"status": "success", "handle": handle, "hash": handle}
+
+        if action == "filter_by_handle":
+            movie_list = self.lists.get(request.get("handle"))
+            if movie_list is None:
+                return {"status": "error", "message": "Unknown handle"}
+            watched = request.get("watched", True)
+            return {"status": "success",
+                    "filtered_movies": [title for title in movie_list if self._is_watched(title) == watched]}
+
+        if action == "filter_by_status":
+            movie_list = request.get("movie_list", [])
+            watched = request.get("watched", True)
+            return {"status": "success",
+                    "filtered_movies": [title for title in movie_list if self._is_watched(title) == watched]}
+
+        return {"status": "error", "message": f"Unknown action: {action}"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the watched status service")
+    parser.add_argument("--endpoint", default="tcp://*:5557")
+    parser.add_argument("--publish-endpoint", default="tcp://*:5558",
+                        help="where to publish change events, empty to turn them off")
+    args = parser.parse_args()
+    WatchedStatusServer(args.endpoint, args.publish_endpoint or None).serve()
+
+
+if __name__ == "__main__":
+    main()
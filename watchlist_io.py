@@ -0,0 +1,165 @@
+import csv
+import json
+from datetime import date
+from itertools import islice
+
+FIELDS = ["title", "watched", "rating", "watch_date"]
+
+
+class RecordError(ValueError):
+    """A record that could not be read, the message says on which line"""
+
+
+def parse_rating(value):
+    """Parses a rating, which like in the menu has to be a whole number from 1 to 10"""
+    try:
+        # a bool or a float like 7.5 would turn into an int without complaint
+        if isinstance(value, bool) or not isinstance(value, (int, str)):
+            raise ValueError
+        rating = int(value)
+    except ValueError:
+        shown = value.strip() if isinstance(value, str) else value
+        raise ValueError(f"rating must be a whole number from 1 to 10, not {shown!r}")
+    if not 1 <= rating <= 10:
+        raise ValueError(f"rating must be from 1 to 10, not {rating}")
+    return rating
+
+
+def chunked(iterable, size):
+    """Yields lists of up to size items without reading further ahead"""
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def iter_records(watchlist, chunk_size=1000):
+    """
+    Yields a record (title, watched, rating, watch_date) for every movie in the watchlist.
+    Watch statuses are fetched one chunk at a time, so only chunk_size records are held at once.
+    """
+    # titles() is a copy taken under the watchlist's lock, iterated once: change events and resyncs edit the
+    # watchlist from other threads, and iterating it live would fail as soon as one did. The copy only holds
+    # references to the title strings, the records are still built a chunk at a time.
+    for chunk in chunked(watchlist.titles(), chunk_size):
+        statuses = None
+        if watchlist.watch_service_available:
+            statuses = watchlist.watched_status_client.get_status_many(chunk)
+        for title in chunk:
+            status = (statuses or {}).get(title) or {}
+            yield {"title": title, "watched": status.get("watched"), "rating": status.get("rating"),
+                   "watch_date": status.get("watch_date")}
+
+
+def write_jsonl(records, f):
+    """Writes one JSON object per line, returns the number of records written"""
+    count = 0
+    for record in records:
+        f.write(json.dumps(record) + "\n")
+        count += 1
+    return count
+
+
+def write_csv(records, f):
+    """Writes records as CSV with a header row, returns the number of records written"""
+    writer = csv.DictWriter(f, fieldnames=FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    count = 0
+    for record in records:
+        writer.writerow(record)
+        count += 1
+    return count
+
+
+def read_jsonl(f):
+    """Yields records from a JSON lines file, skipping blank lines. Raises RecordError for a malformed line."""
+    for number, line in enumerate(f, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise RecordError(f"line {number}: not valid JSON ({e})")
+        if not isinstance(record, dict):
+            raise RecordError(f"line {number}: expected a JSON object")
+        yield _normalise(record, number)
+
+
+def read_csv(f):
+    """Yields records from a CSV file with a header row. Raises RecordError for a bad rating or watch date."""
+    reader = csv.DictReader(f)
+    for row in reader:
+        yield _normalise({
+            "title": row.get("title") or "",
+            "watched": (row.get("watched") or "").strip().lower() in ("true", "1", "yes"),
+            "rating": (row.get("rating") or "").strip() or None,
+            "watch_date": (row.get("watch_date") or "").strip() or None,
+        }, reader.line_num)
+
+
+def _normalise(record, number):
+    """Checks a record's title, rating and watch date, raising RecordError with the line number if they are invalid"""
+    title = record.get("title")
+    if not isinstance(title, str):
+        raise RecordError(f"line {number}: title must be a string, not {title!r}")
+    rating = record.get("rating")
+    if rating is not None:
+        try:
+            rating = parse_rating(rating)
+        except ValueError as e:
+            raise RecordError(f"line {number}: {e}")
+    watch_date = record.get("watch_date")
+    if watch_date is not None:
+        try:
+            # the watch statistics order movies by comparing these strings, so they are stored as YYYY-MM-DD
+            if not isinstance(watch_date, str):
+                raise ValueError
+            watch_date = date.fromisoformat(watch_date.strip()).isoformat()
+        except ValueError:
+            raise RecordError(f"line {number}: watch_date must be a YYYY-MM-DD date, not {watch_date!r}")
+    return {"title": title.strip(), "watched": bool(record.get("watched")), "rating": rating,
+            "watch_date": watch_date}
+
+
+def import_records(watchlist, records, chunk_size=1000):
+    """
+    Adds every record's title to the watchlist and marks the watched ones, one chunk at a time.
+    Returns (titles added, movies marked watched, titles whose watch status could not be saved).
+    If a record can't be read, the ones before it are still imported and the RecordError is raised
+    with the results so far as its added, marked and unmarked attributes.
+    """
+    errors = []
+    added = marked = 0
+    unmarked = []
+    for chunk in chunked(_until_error(records, errors), chunk_size):
+        watched = []
+        for record in chunk:
+            if watchlist.add(record["title"], quiet=True):
+                added += 1
+            if record["watched"] and record["title"]:
+                watched.append((record["title"].title(), record["rating"], record["watch_date"]))
+        if not watched:
+            continue
+        if watchlist.mark_many_as_watched(watched):
+            marked += len(watched)
+        else:
+            # the titles are in the watchlist, but their rating and watch date are lost
+            unmarked.extend(title for title, rating, watch_date in watched)
+    if errors:
+        errors[0].added, errors[0].marked, errors[0].unmarked = added, marked, unmarked
+        raise errors[0]
+    return added, marked, unmarked
+
+
+def _until_error(records, errors):
+    """Yields records until one can't be read, keeping its RecordError in errors"""
+    try:
+        yield from records
+    except RecordError as e:
+        errors.append(e)
+
+
+READERS = {"jsonl": read_jsonl, "csv": read_csv}
+WRITERS = {"jsonl": write_jsonl, "csv": write_csv}
@@ -0,0 +1,46 @@
+import hashlib
+import json
+
+try:
+    import msgpack
+except ImportError:
+    # msgpack is optional, without it everything stays on JSON
+    msgpack = None
+
+# the "version" field of every request names the wire encoding it was sent in
+JSON_VERSION = 1
+MSGPACK_VERSION = 2
+
+
+def supported_versions():
+    """Returns the wire versions this process can speak, most preferred first"""
+    if msgpack is not None:
+        return [MSGPACK_VERSION, JSON_VERSION]
+    return [JSON_VERSION]
+
+
+def choose_version(offered):
+    """Picks the best version out of those offered by the other side"""
+    for version in supported_versions():
+        if version in offered:
+            return version
+    return JSON_VERSION
+
+
+def encode(data, version=JSON_VERSION):
+    """Encodes a message for the wire, in JSON for a version this process can't speak"""
+    if version == MSGPACK_VERSION and msgpack is not None:
+        return msgpack.packb(data, use_bin_type=True)
+    return json.dumps(data).encode("utf-8")
+
+
+def decode(frame):
+    """Decodes a message from the wire. JSON messages are objects so they always start with "{"."""
+    if frame[:1] == b"{" or msgpack is None:
+        return json.loads(frame)
+    return msgpack.unpackb(frame, raw=False)
+
+
+def content_hash(movie_list):
+    """Hash identifying a registered movie list, computed the same way by clients and services"""
+    return hashlib.sha1("\n".join(movie_list).encode("utf-8")).hexdigest()